@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # not Linux or not installed: fall back to rescanning
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+# Layout shared with the webhook receiver:
+#   <root>/staging/<batch_id>/     written by the receiver, never read from here
+#   <root>/ready/<batch_id>/       renamed in by the receiver once every file is written
+#   <root>/processing/<batch_id>/  claimed by this service while it is analyzed
+#   <root>/done/<batch_id>.json    written when analysis ends: where its report is
+# Each batch holds version1/ and version2/ with the C sources of one push. Renames
+# within one filesystem are atomic, so a batch in ready/ is always complete.
+BATCH_ROOT = os.getenv("BATCH_ROOT", "/shared/batches")
+# Batches held in memory waiting for analysis; further batches wait on disk in ready/
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "16"))
+# Safety-net rescan of ready/ (and the poll interval when inotify is unavailable)
+BATCH_RESCAN_INTERVAL = float(os.getenv("BATCH_RESCAN_INTERVAL", "30"))
+
+
+class BatchIntake:
+    # Watches ready/ with inotify and feeds batch ids, oldest first, into a bounded
+    # queue. Batch ids start with a timestamp, so sorting them gives arrival order.
+
+    def __init__(self, batch_root=BATCH_ROOT, max_queued=BATCH_QUEUE_SIZE, rescan_interval=BATCH_RESCAN_INTERVAL):
+        self.ready_dir = os.path.join(batch_root, 'ready')
+        self.processing_dir = os.path.join(batch_root, 'processing')
+        self.staging_dir = os.path.join(batch_root, 'staging')
+        self.done_dir = os.path.join(batch_root, 'done')
+        self.rescan_interval = rescan_interval
+        self.queue = queue.Queue(maxsize=max_queued)
+        self._known = set()  # batch ids queued or being processed
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        for directory in (self.ready_dir, self.processing_dir, self.staging_dir, self.done_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="batch-intake", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _recover(self):
+        # Batches claimed by a previous run that did not finish are analyzed again
+        for batch_id in os.listdir(self.processing_dir):
+            logger.info(f"Requeueing interrupted batch {batch_id}")
+            os.rename(os.path.join(self.processing_dir, batch_id), os.path.join(self.ready_dir, batch_id))
+
+    def _open_inotify(self):
+        if INotify is None:
+            logger.warning(f"inotify_simple is not available; polling {self.ready_dir} "
+                           f"every {self.rescan_interval}s")
+            return None
+        inotify = INotify()
+        inotify.add_watch(self.ready_dir, flags.MOVED_TO | flags.ONLYDIR)
+        return inotify
+
+    def _run(self):
+        inotify = self._open_inotify()
+        # Pick up batches that arrived while the service was down
+        self._scan()
+        while not self._stopped.is_set():
+            if inotify is None:
+                self._stopped.wait(self.rescan_interval)
+                self._scan()
+                continue
+            events = inotify.read(timeout=int(self.rescan_interval * 1000))
+            if not events or any(event.mask & flags.Q_OVERFLOW for event in events):
+                # Timed out or the kernel dropped events while the queue was full
+                self._scan()
+                continue
+            for batch_id in sorted(event.name for event in events if event.name):
+                self._offer(batch_id)
+
+    def _scan(self):
+        for batch_id in sorted(os.listdir(self.ready_dir)):
+            self._offer(batch_id)
+
+    def _offer(self, batch_id):
+        if batch_id.startswith('.'):
+            return
+        with self._lock:
+            if batch_id in self._known:
+                return
+            self._known.add(batch_id)
+        logger.info(f"Queued batch {batch_id} ({self.queue.qsize()} already waiting)")
+        # Blocks while the queue is full; the batch stays safely in ready/ meanwhile
+        self.queue.put(batch_id)
+
+    def get(self, timeout=None):
+        # Claims the next batch and returns (batch_id, directory) to analyze
+        while True:
+            batch_id = self.queue.get(timeout=timeout)
+            processing_path = os.path.join(self.processing_dir, batch_id)
+            try:
+                os.rename(os.path.join(self.ready_dir, batch_id), processing_path)
+            except FileNotFoundError:
+                logger.warning(f"Batch {batch_id} disappeared before it was processed")
+                self._forget(batch_id)
+                continue
+            return batch_id, processing_path
+
+    def done(self, batch_id, report_file=None):
+        # Records where the batch's report went (None when analysis failed) before its
+        # sources are removed, so every claimed batch can be traced to its output
+        self._write_record(batch_id, {
+            'batch_id': batch_id,
+            'report': report_file,
+            'status': 'completed' if report_file else 'failed',
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        })
+        shutil.rmtree(os.path.join(self.processing_dir, batch_id), ignore_errors=True)
+        self._forget(batch_id)
+
+    def _write_record(self, batch_id, record):
+        fd, tmp_path = tempfile.mkstemp(dir=self.done_dir, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, os.path.join(self.done_dir, f'{batch_id}.json'))
+        except OSError as e:
+            logger.warning(f"Could not record the outcome of batch {batch_id}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _forget(self, batch_id):
+        with self._lock:
+            self._known.discard(batch_id)
+        self.queue.task_done()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Compares the original list-of-dicts radiff parser with the streaming and columnar
+# parsers in radiff_parser.py on synthetic radiff2 -A -C output.
+#
+#   python benchmarks/bench_radiff_parser.py --sizes 10000 100000 1000000
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from radiff_parser import RadiffTable, iter_function_differences  # noqa: E402
+from synthetic import write_synthetic_radiff  # noqa: E402
+
+
+def legacy_extract_function_differences(radiff_output_file):
+    # The implementation this module replaced, kept here as the baseline
+    differences = []
+    with open(radiff_output_file, 'r') as f:
+        for line in f:
+            pattern = r'^(\S+)\s+(\d+)\s+(\S+)\s+\|\s+(\S+)\s+\(([\d\.]+)\)\s+\|\s+(\S+)\s+(\d+)\s+(\S+)$'
+            match = re.match(pattern, line.strip())
+            if match:
+                similarity = float(match.group(5))
+                if similarity < 1.0:
+                    differences.append({
+                        'function_name': match.group(1),
+                        'similarity': similarity,
+                        'address1': match.group(3),
+                        'size1': int(match.group(2)),
+                        'address2': match.group(6),
+                        'size2': int(match.group(7))
+                    })
+    return differences
+
+
+def run_legacy(path):
+    return len(legacy_extract_function_differences(path))
+
+
+def run_streaming(path):
+    return sum(1 for _ in iter_function_differences(path))
+
+
+def run_columnar(path):
+    # Keeps every row, then filters and sorts the changed functions by similarity
+    table = RadiffTable.from_file(path)
+    changed = table.sorted_by('similarity', table.where(max_similarity=1.0))
+    return len(changed)
+
+
+CASES = [('legacy', run_legacy), ('streaming', run_streaming), ('columnar', run_columnar)]
+
+
+def measure(func, path):
+    start = time.perf_counter()
+    result = func(path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark radiff output parsers")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="Number of radiff lines per synthetic file")
+    args = parser.parse_args()
+
+    print(f"{'lines':>10} {'parser':>10} {'rows':>8} {'seconds':>9} {'lines/s':>11} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for lines in args.sizes:
+            path = os.path.join(temp_dir, f"radiff_{lines}.txt")
+            write_synthetic_radiff(path, lines)
+            for name, func in CASES:
+                rows, elapsed, peak = measure(func, path)
+                print(f"{lines:>10} {name:>10} {rows:>8} {elapsed:>9.3f} {lines / elapsed:>11,.0f} "
+                      f"{peak / 1024 / 1024:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
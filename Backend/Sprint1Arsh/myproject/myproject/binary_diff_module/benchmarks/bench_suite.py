@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# Benchmarks parsing, indexing, lookup and report generation of the binary diff module
+# on synthetic radiff2/Ghidra output from 1k to 1M functions. Each case runs in a fresh
+# interpreter so its peak RSS is its own. Results are saved as JSON and can be
+# compared against an earlier run to catch regressions.
+#
+#   python benchmarks/bench_suite.py --sizes 1000 10000 100000
+#   python benchmarks/bench_suite.py --compare benchmarks/results/<earlier>.json
+
+import argparse
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, MODULE_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from synthetic import write_synthetic_decompiled, write_synthetic_radiff  # noqa: E402
+
+# Not tracked; see benchmarks/.gitignore
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+WARM_UP_MODULES = ('function_index', 'module_script', 'radiff_parser', 'report_writer')
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+# Lookups made by the extract_function_code case; the text is indexed on the first one
+CODE_LOOKUPS = 1000
+# Slowdowns smaller than this are timer noise, whatever their relative size
+NOISE_FLOOR_SECONDS = 0.05
+
+
+def case_parse(files, functions):
+    from module_script import extract_function_differences
+    return len(extract_function_differences(files['radiff']))
+
+
+def case_index(files, functions):
+    from function_index import FunctionIndex
+    return len(FunctionIndex.build(files['decompiled1']).functions)
+
+
+def case_extract_function_code(files, functions):
+    from module_script import extract_function_code
+    with open(files['decompiled1']) as f:
+        decompiled_code = f.read()
+    step = max(1, functions // CODE_LOOKUPS)
+    for i in range(0, functions, step):
+        extract_function_code(decompiled_code, f"sym.func_{i:07d}")
+    return len(range(0, functions, step))
+
+
+def case_report(files, functions):
+    from module_script import jsonl_path_for
+    from report_writer import JsonlReportWriter, render_text_report
+    jsonl_file = jsonl_path_for(files['report'])
+    with JsonlReportWriter(jsonl_file) as writer:
+        writer.write_functions(files['radiff'], files['decompiled1'], files['decompiled2'])
+    render_text_report(jsonl_file, files['report'])
+    return functions
+
+
+# name -> (function, what its items count)
+CASES = {
+    'parse': (case_parse, 'radiff rows kept'),
+    'index': (case_index, 'functions indexed'),
+    'extract_function_code': (case_extract_function_code, 'lookups'),
+    'report': (case_report, 'functions'),
+}
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class AnonRssSampler(threading.Thread):
+    # ru_maxrss also counts file pages touched through mmap, which are page cache rather
+    # than memory the process owns; RssAnon (Linux only) is sampled to separate the two
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kib = None
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def read_kib():
+        try:
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('RssAnon:'):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return None
+
+    def run(self):
+        while not self._stopped.is_set():
+            value = self.read_kib()
+            if value is None:
+                return
+            self.peak_kib = max(self.peak_kib or 0, value)
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        return self.peak_kib / 1024 if self.peak_kib is not None else None
+
+
+def run_case(name, files, functions, results):
+    # Runs in a spawned interpreter; the baseline is the RSS after imports
+    import logging
+    logging.disable(logging.CRITICAL)
+    # Every module a case uses is imported before the baseline is taken, so import time
+    # and module memory are not counted against the case
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
+    import function_index
+    for path in (files['decompiled1'], files['decompiled2']):
+        index_file = function_index.index_path_for(path)
+        if os.path.exists(index_file):
+            os.unlink(index_file)
+    baseline = peak_rss_mib()
+    anon_baseline = AnonRssSampler.read_kib()
+    sampler = AnonRssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    items = CASES[name][0](files, functions)
+    elapsed = time.perf_counter() - start
+    anon_peak = sampler.stop()
+    results.put({'items': items, 'seconds': elapsed, 'peak_rss_mib': peak_rss_mib(),
+                 'baseline_rss_mib': baseline,
+                 'anon_mib': anon_peak - anon_baseline / 1024 if anon_peak is not None else None})
+
+
+def measure(name, files, functions, repeat):
+    # Best time of `repeat` fresh processes; memory from the run that used the most
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        results = context.Queue()
+        process = context.Process(target=run_case, args=(name, files, functions, results))
+        process.start()
+        runs.append(results.get())
+        process.join()
+    best = min(runs, key=lambda r: r['seconds'])
+    worst = max(runs, key=lambda r: r['peak_rss_mib'] - r['baseline_rss_mib'])
+    return dict(worst, seconds=best['seconds'])
+
+
+def generate(temp_dir, functions):
+    files = {
+        'radiff': os.path.join(temp_dir, f"radiff_{functions}.txt"),
+        'decompiled1': os.path.join(temp_dir, f"binary1_{functions}.decompiled.txt"),
+        'decompiled2': os.path.join(temp_dir, f"binary2_{functions}.decompiled.txt"),
+        'report': os.path.join(temp_dir, f"diff_report_{functions}.txt"),
+    }
+    write_synthetic_radiff(files['radiff'], functions)
+    write_synthetic_decompiled(files['decompiled1'], functions, version=1, binary="binary1.bin")
+    write_synthetic_decompiled(files['decompiled2'], functions, version=2, binary="binary2.bin")
+    return files
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=MODULE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def scaling_exponents(results):
+    # Slope of log(time) over log(size) between consecutive sizes: ~1.0 is linear
+    by_case = {}
+    for result in results:
+        by_case.setdefault(result['case'], []).append(result)
+    for runs in by_case.values():
+        runs.sort(key=lambda r: r['functions'])
+        for previous, current in zip(runs, runs[1:]):
+            if previous['seconds'] > 0 and current['seconds'] > 0:
+                current['scaling'] = (math.log(current['seconds'] / previous['seconds'])
+                                      / math.log(current['functions'] / previous['functions']))
+
+
+def compare(results, baseline_file, threshold):
+    # Returns the (case, functions) pairs that got slower or bigger than the baseline allows
+    with open(baseline_file) as f:
+        baseline = {(r['case'], r['functions']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\nCompared with {baseline_file} (threshold {threshold:.0%}):")
+    for result in results:
+        before = baseline.get((result['case'], result['functions']))
+        if before is None:
+            continue
+        time_change = result['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.0
+        # Anonymous memory when both runs have it; mapped file pages are not a regression
+        memory_key = 'anon_mib' if result.get('anon_mib') is not None and before.get('anon_mib') is not None \
+            else 'rss_mib'
+        rss_change = result[memory_key] / before[memory_key] - 1 if before[memory_key] > 1 else 0.0
+        flag = ''
+        slower = time_change > threshold and result['seconds'] - before['seconds'] > NOISE_FLOOR_SECONDS
+        if slower or rss_change > threshold:
+            flag = '  REGRESSION'
+            regressions.append((result['case'], result['functions']))
+        print(f"{result['case']:>22} {result['functions']:>9} time {time_change:+7.1%} "
+              f"memory {rss_change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the binary diff module")
+    parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Number of functions per synthetic binary")
+    parser.add_argument("--cases", nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is kept")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>-<rev>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown or RSS growth reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'case':>22} {'functions':>9} {'items':>10} {'seconds':>9} {'items/s':>12} {'rss MiB':>8} "
+          f"{'anon MiB':>8}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for functions in sorted(args.sizes):
+            files = generate(temp_dir, functions)
+            for name in args.cases:
+                measured = measure(name, files, functions, args.repeat)
+                result = {
+                    'case': name,
+                    'functions': functions,
+                    'items': measured['items'],
+                    'items_unit': CASES[name][1],
+                    'seconds': measured['seconds'],
+                    'items_per_second': measured['items'] / measured['seconds'] if measured['seconds'] else None,
+                    # Growth over the interpreter with the modules imported
+                    'rss_mib': measured['peak_rss_mib'] - measured['baseline_rss_mib'],
+                    'peak_rss_mib': measured['peak_rss_mib'],
+                    # Growth of anonymous memory only (heap), without mapped file pages
+                    'anon_mib': measured['anon_mib'],
+                    'input_bytes': sum(os.path.getsize(files[key]) for key in ('radiff', 'decompiled1', 'decompiled2')),
+                }
+                results.append(result)
+                print(f"{name:>22} {functions:>9} {result['items']:>10} {result['seconds']:>9.3f} "
+                      f"{result['items_per_second'] or 0:>12,.0f} {result['rss_mib']:>8.1f} "
+                      f"{result['anon_mib'] if result['anon_mib'] is not None else float('nan'):>8.1f}")
+
+    scaling_exponents(results)
+    print("\nScaling (time exponent between consecutive sizes, 1.0 = linear):")
+    for result in results:
+        if 'scaling' in result:
+            print(f"{result['case']:>22} {result['functions']:>9} {result['scaling']:>6.2f}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{git_revision()}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'created': datetime.now(timezone.utc).isoformat(),
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
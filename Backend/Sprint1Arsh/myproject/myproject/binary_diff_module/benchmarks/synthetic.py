@@ -0,0 +1,82 @@
+# Synthetic radiff2 and Ghidra outputs for the benchmarks. Both generators use the
+# same function names (sym.func_NNNNNNN in radiff2, func_NNNNNNN in Ghidra), so a
+# radiff file and a pair of decompiled files of the same size and seed line up.
+
+import random
+
+GHIDRA_PREAMBLE = """\
+openjdk version "17.0.9" 2023-10-17
+INFO  Using log config file: jar:file:/ghidra/Ghidra/Framework/Generic/lib/Generic.jar!/generic.log4j.xml (LoggingInitialization)
+INFO  Loading user preferences: /root/.ghidra/.ghidra_10.4_PUBLIC/preferences (Preferences)
+INFO  Class search complete (1028 ms) (ClassSearcher)
+INFO  Initializing SSL Context (SSLContextInitializer)
+INFO  HEADLESS Script Paths:
+    /ghidra/Ghidra/Features/Decompiler/ghidra_scripts
+    /ghidra/Ghidra/Features/Base/ghidra_scripts
+INFO  HEADLESS: execution starts (HeadlessAnalyzer)
+INFO  Analyzing /app/input_binaries/{binary} (HeadlessAnalyzer)
+INFO  ANALYZING all memory and code: /app/input_binaries/{binary} (HeadlessAnalyzer)
+INFO  -----------------------------------------------------
+    Decompiler Switch Analysis                 0.104 secs
+    Function Start Search                      0.012 secs
+INFO  -----------------------------------------------------
+INFO  SCRIPT: /ghidra/Ghidra/Features/Decompiler/ghidra_scripts/DecompileHeadless.java (HeadlessAnalyzer)
+typedef unsigned char   undefined;
+
+typedef unsigned char    byte;
+typedef unsigned int    dword;
+typedef unsigned long    qword;
+typedef unsigned long long    undefined8;
+
+"""
+
+GHIDRA_EPILOGUE = "INFO  REPORT: Post-analysis succeeded for file: /{binary} (HeadlessAnalyzer)\n"
+
+
+def iter_radiff_rows(functions, seed=0):
+    # (name, size1, address1, status, similarity, size2) per function. Mostly MATCH
+    # rows with some UNMATCH and NEW, like a diff of two close builds.
+    rng = random.Random(seed)
+    for i in range(functions):
+        name = f"sym.func_{i:07d}"
+        size1 = rng.randint(6, 4000)
+        addr1 = 0x1000 + i * 0x40
+        roll = rng.random()
+        if roll < 0.9:
+            yield name, size1, addr1, 'MATCH', 1.0, size1
+        elif roll < 0.98:
+            yield name, size1, addr1, 'UNMATCH', rng.random(), max(1, size1 + rng.randint(-20, 20))
+        else:
+            yield name, size1, addr1, 'NEW', 0.0, None
+
+
+def write_synthetic_radiff(path, functions, seed=0):
+    with open(path, 'w') as f:
+        for name, size1, addr1, status, similarity, size2 in iter_radiff_rows(functions, seed):
+            if status == 'MATCH':
+                f.write(f"{name:>24} {size1:4d} 0x{addr1:x} |   MATCH  (1.000000) | 0x{addr1:x}  {size1:4d} {name}\n")
+            elif status == 'UNMATCH':
+                f.write(f"{name:>24} {size1:4d} 0x{addr1:x} | UNMATCH  ({similarity:f}) | "
+                        f"0x{addr1 + 0x10:x}  {size2:4d} {name}\n")
+            else:
+                f.write(f"{name:>24} {size1:4d} 0x{addr1:x} |     NEW  (0.000000)\n")
+
+
+def write_synthetic_decompiled(path, functions, seed=0, version=1, binary="binary.bin"):
+    # Ghidra headless output: JVM/Ghidra preamble, typedefs, then one function per
+    # radiff row. version=2 rewrites the bodies of the rows radiff marks UNMATCH.
+    rng = random.Random(seed + 1)
+    with open(path, 'w') as f:
+        f.write(GHIDRA_PREAMBLE.format(binary=binary))
+        for i, (_, _, _, status, _, _) in enumerate(iter_radiff_rows(functions, seed)):
+            statements = rng.randint(2, 30)
+            constant = i if version == 1 or status != 'UNMATCH' else i * 7 + 1
+            f.write(f"undefined8 func_{i:07d}(long param_1,int param_2)\n\n{{\n")
+            f.write("  long lVar1;\n  int iVar2;\n  \n")
+            for j in range(statements):
+                f.write(f"  iVar2 = (int)param_1 * {j + 3} + param_2 + {constant};\n")
+                if j % 5 == 4:
+                    f.write(f"  if (iVar2 < {constant}) {{\n    lVar1 = func_{(i + j) % functions:07d}"
+                            f"(param_1,iVar2);\n  }}\n")
+            f.write("  return (long)iVar2;\n}\n\n")
+        f.write(GHIDRA_EPILOGUE.format(binary=binary))
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from decompile_cache import ContentCache, file_sha256
+
+logger = logging.getLogger(__name__)
+
+COMPILE_CACHE_DIR = os.getenv("COMPILE_CACHE_DIR", "/shared/cache/compiled")
+COMPILE_CACHE_MAX_BYTES = int(os.getenv("COMPILE_CACHE_MAX_BYTES", str(1024 ** 3)))
+COMPILER = os.getenv("CC", "gcc")
+COMPILE_FLAGS = shlex.split(os.getenv("COMPILE_FLAGS", "-g"))
+# Number of compiler processes run at the same time when a push contains several sources
+COMPILE_WORKERS = int(os.getenv("COMPILE_WORKERS", str(os.cpu_count() or 1)))
+
+_compiler_versions = {}
+
+
+def compiler_version(compiler=COMPILER):
+    # Full `--version` banner plus target triple, so an upgraded or swapped toolchain misses
+    if compiler not in _compiler_versions:
+        version = subprocess.run([compiler, '--version'], capture_output=True, text=True, check=True).stdout
+        machine = subprocess.run([compiler, '-dumpmachine'], capture_output=True, text=True).stdout
+        _compiler_versions[compiler] = f"{version.strip()}\n{machine.strip()}"
+    return _compiler_versions[compiler]
+
+
+def compile_source(source_path, output_binary, compiler=COMPILER, flags=COMPILE_FLAGS):
+    # Runs in a pool worker. The compiler is started in the source directory with that
+    # directory mapped to "." so the debug info does not record the batch directory;
+    # identical sources then build to identical bytes wherever they were checked out.
+    source_dir = os.path.dirname(os.path.abspath(source_path))
+    command = [compiler, *flags, f"-ffile-prefix-map={source_dir}=.",
+               os.path.basename(source_path), "-o", os.path.abspath(output_binary)]
+    result = subprocess.run(command, cwd=source_dir, capture_output=True, text=True)
+    return result.returncode == 0, result.stderr
+
+
+class CompileCache(ContentCache):
+    # Compiled binaries keyed by the source bytes, its file name (recorded in the debug
+    # info), the compiler flags and the compiler version
+    name = 'compile'
+    suffix = '.bin'
+
+    def __init__(self, cache_dir=COMPILE_CACHE_DIR, max_bytes=COMPILE_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def key_for(self, source_path, compiler=COMPILER, flags=COMPILE_FLAGS):
+        digest = hashlib.sha256()
+        for part in (file_sha256(source_path), os.path.basename(source_path), json.dumps(flags),
+                     compiler_version(compiler)):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key, output_file):
+        if not super().get(key, output_file):
+            return False
+        os.chmod(output_file, 0o755)
+        return True
+
+
+class CompileStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+                f"{self.failed} failed, {self.seconds:.2f}s")
+
+
+def compile_all(jobs, cache=None, max_workers=COMPILE_WORKERS, compiler=COMPILER, flags=COMPILE_FLAGS):
+    # jobs: list of (source, output binary). Cached binaries are copied out; the rest
+    # are compiled in a process pool, each distinct source only once. Returns the set
+    # of output binaries that exist afterwards and the CompileStats of the stage.
+    start = time.perf_counter()
+    cache = cache or CompileCache()
+    stats = CompileStats()
+    compiled = set()
+    pending = {}  # cache key -> output binaries waiting for that compile
+    for source, output_binary in jobs:
+        key = cache.key_for(source, compiler, flags)
+        if key in pending:
+            # Same source twice in one push (e.g. unchanged file on both sides)
+            pending[key][1].append(output_binary)
+            stats.hits += 1
+        elif cache.get(key, output_binary):
+            compiled.add(output_binary)
+            stats.hits += 1
+        else:
+            pending[key] = (source, [output_binary])
+            stats.misses += 1
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+            futures = {pool.submit(compile_source, source, outputs[0], compiler, flags): key
+                       for key, (source, outputs) in pending.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                source, outputs = pending[key]
+                try:
+                    succeeded, stderr = future.result()
+                except OSError as e:
+                    succeeded, stderr = False, str(e)
+                if not succeeded:
+                    logger.error(f"Error compiling {source}: {stderr.strip()}")
+                    stats.failed += len(outputs)
+                    continue
+                logger.info(f"Compiled {source} to {outputs[0]}")
+                cache.put(key, outputs[0])
+                compiled.add(outputs[0])
+                for output_binary in outputs[1:]:
+                    if cache.get(key, output_binary):
+                        compiled.add(output_binary)
+
+    stats.seconds = time.perf_counter() - start
+    logger.info(f"Compile stage: {stats}")
+    return compiled, stats
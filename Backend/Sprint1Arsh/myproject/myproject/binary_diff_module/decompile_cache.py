@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the environment of the binary-analysis container
+DEFAULT_CACHE_DIR = os.getenv("DECOMPILE_CACHE_DIR", "/shared/cache/decompiled")
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("DECOMPILE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    # Content-addressed file store. Subclasses decide what goes into the key.
+    # The mtime of each entry doubles as its LRU timestamp: hits touch it and
+    # eviction removes the oldest entries until the cache fits in max_bytes.
+    name = 'content'
+    suffix = '.bin'
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key, output_file):
+        entry = self._entry_path(key)
+        try:
+            shutil.copyfile(entry, output_file)
+        except FileNotFoundError:
+            return False
+        os.utime(entry)
+        logger.info(f"{self.name.capitalize()} cache hit for {os.path.basename(output_file)} ({key[:12]})")
+        return True
+
+    def put(self, key, source_file):
+        entry = self._entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a concurrent reader never sees a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=entry.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(source_file, tmp_path)
+            os.replace(tmp_path, entry)
+        except OSError as e:
+            logger.error(f"Error storing {source_file} in {self.name} cache: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        logger.info(f"Stored {os.path.basename(source_file)} in {self.name} cache ({key[:12]})")
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self.cache_dir.glob(f'*/*{self.suffix}'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+                total -= size
+                logger.info(f"Evicted {entry.name} from {self.name} cache")
+            except FileNotFoundError:
+                total -= size
+
+
+class DecompileCache(ContentCache):
+    # Ghidra output keyed by the SHA-256 of the binary plus the decompiler image,
+    # so bumping the image invalidates it
+    name = 'decompile'
+    suffix = '.decompiled.txt'
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def key_for(self, binary_path, image):
+        digest = hashlib.sha256()
+        digest.update(file_sha256(binary_path).encode())
+        digest.update(b'\0')
+        digest.update(image.encode())
+        return digest.hexdigest()
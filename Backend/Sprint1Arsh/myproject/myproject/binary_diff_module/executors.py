@@ -0,0 +1,156 @@
+import logging
+import os
+import shlex
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+# Decompiler image; part of the decompile cache key so an image bump invalidates old output
+GHIDRA_IMAGE = os.getenv("GHIDRA_IMAGE", "cincan/ghidra-decompiler:latest")
+
+# Which backend runs the decompile and radiff stages: "kubernetes" or "local"
+EXECUTOR = os.getenv("EXECUTOR", "kubernetes")
+
+# Local backend settings. Commands are templates filled with {binary}, {binary_dir},
+# {binary_name}, {binary1}, {binary2} and {image}; the decompile command writes the
+# Ghidra output to stdout, like the Job does.
+LOCAL_MAX_WORKERS = int(os.getenv("LOCAL_MAX_WORKERS", str(os.cpu_count() or 1)))
+LOCAL_DECOMPILE_COMMAND = os.getenv(
+    "LOCAL_DECOMPILE_COMMAND",
+    "docker run --rm -v {binary_dir}:/app/input_binaries {image} decompile /app/input_binaries/{binary_name}")
+LOCAL_RADIFF_COMMAND = os.getenv("LOCAL_RADIFF_COMMAND", "radiff2 -A -C {binary1} {binary2}")
+LOCAL_STAGE_TIMEOUT = int(os.getenv("LOCAL_STAGE_TIMEOUT", "600"))
+
+
+class Executor:
+    # Runs the decompile and radiff stages of the pipeline. Compilation, caching and
+    # report generation stay in module_script.py and are the same for every backend.
+
+    def upload_binaries(self, binaries):
+        # Make the compiled binaries available to the backend; returns False to abort the run
+        return True
+
+    def decompile(self, binaries, output_dir):
+        # Returns binary name -> <output_dir>/<binary name>.decompiled.txt for every success
+        raise NotImplementedError
+
+    def store_decompiled(self, decompiled_files):
+        # Hook for backends that keep a copy of the decompiled output next to the binaries
+        pass
+
+    def radiff(self, binary1, binary2, output_file):
+        # Writes `radiff2 -A -C binary1 binary2` output to output_file; returns True on success
+        raise NotImplementedError
+
+    def radiff_pairs(self, pairs):
+        # pairs: list of (binary1, binary2, output_file). Returns output_file -> success.
+        # Backends override this to run the comparisons concurrently.
+        return {output_file: self.radiff(binary1, binary2, output_file) for binary1, binary2, output_file in pairs}
+
+    def shutdown(self):
+        # Releases worker processes or connections held between stages
+        pass
+
+
+def _run_to_file(command, output_file, timeout, merge_stderr):
+    # Runs in a pool worker: executes the command with stdout (and optionally stderr,
+    # as in Job logs) going straight to output_file
+    tmp_file = f"{output_file}.part"
+    try:
+        with open(tmp_file, 'wb') as out:
+            result = subprocess.run(command, stdout=out, stderr=subprocess.STDOUT if merge_stderr else None,
+                                    timeout=timeout)
+        if result.returncode != 0:
+            return False
+        os.replace(tmp_file, output_file)
+        return True
+    finally:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+
+
+class LocalExecutor(Executor):
+    # Runs every stage as a subprocess on this machine, at most max_workers at a time.
+    # Used for small deployments and CI, where scheduling pods costs more than the work.
+
+    def __init__(self, max_workers=LOCAL_MAX_WORKERS, decompile_command=LOCAL_DECOMPILE_COMMAND,
+                 radiff_command=LOCAL_RADIFF_COMMAND, timeout=LOCAL_STAGE_TIMEOUT):
+        self.max_workers = max_workers
+        self.decompile_command = decompile_command
+        self.radiff_command = radiff_command
+        self.timeout = timeout
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _command(self, template, **values):
+        return [part.format(image=GHIDRA_IMAGE, **values) for part in shlex.split(template)]
+
+    def decompile(self, binaries, output_dir):
+        futures = {}
+        for binary in binaries:
+            binary = os.path.abspath(binary)
+            binary_name = os.path.basename(binary)
+            command = self._command(self.decompile_command, binary=binary,
+                                    binary_dir=os.path.dirname(binary), binary_name=binary_name)
+            output_file = os.path.join(output_dir, f'{binary_name}.decompiled.txt')
+            future = self.pool.submit(_run_to_file, command, output_file, self.timeout, True)
+            futures[future] = (binary_name, output_file)
+
+        decompiled = {}
+        for future in as_completed(futures):
+            binary_name, output_file = futures[future]
+            try:
+                succeeded = future.result()
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error(f"Error decompiling {binary_name}: {e}")
+                continue
+            if succeeded:
+                logger.info(f"Decompiled {binary_name} to {output_file}")
+                decompiled[binary_name] = output_file
+            else:
+                logger.error(f"Decompiler exited with an error for {binary_name}")
+        return decompiled
+
+    def radiff(self, binary1, binary2, output_file):
+        return self.radiff_pairs([(binary1, binary2, output_file)])[output_file]
+
+    def radiff_pairs(self, pairs):
+        futures = {}
+        for binary1, binary2, output_file in pairs:
+            command = self._command(self.radiff_command, binary1=os.path.abspath(binary1),
+                                    binary2=os.path.abspath(binary2))
+            futures[self.pool.submit(_run_to_file, command, output_file, self.timeout, False)] = output_file
+
+        results = {}
+        for future in as_completed(futures):
+            output_file = futures[future]
+            try:
+                results[output_file] = future.result()
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error(f"Error running radiff2 for {output_file}: {e}")
+                results[output_file] = False
+                continue
+            if not results[output_file]:
+                logger.error(f"radiff2 exited with an error for {output_file}")
+        return results
+
+
+def get_executor(name=EXECUTOR):
+    if name == 'local':
+        return LocalExecutor()
+    elif name == 'kubernetes':
+        # Imported here so the local backend works without the kubernetes package installed
+        from kubernetes_executor import KubernetesExecutor
+        return KubernetesExecutor()
+    raise ValueError(f"Unknown executor: {name}")
@@ -0,0 +1,341 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+from decompile_cache import file_sha256
+from function_index import clean_function_name
+from radiff_parser import iter_radiff_records
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_STORE_DIR = os.getenv("FINGERPRINT_STORE_DIR", "/shared/cache/fingerprints")
+FINGERPRINT_STORE_MAX_BYTES = int(os.getenv("FINGERPRINT_STORE_MAX_BYTES", str(256 * 1024 ** 2)))
+# Remembered radiff rows for changed functions, oldest dropped first
+FINGERPRINT_MAX_COMPARISONS = int(os.getenv("FINGERPRINT_MAX_COMPARISONS", "200000"))
+
+FINGERPRINT_VERSION = 1
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+STT_FUNC = 2
+EM_386 = 3
+EM_X86_64 = 62
+
+# Opcodes whose ModRM byte may address memory RIP-relative with no immediate after
+# the displacement (mov, lea, cmp, add, sub, or, and, xor, test, xchg)
+RIP_RELATIVE_OPCODES = frozenset(b'\x89\x8b\x8d\x39\x3b\x01\x03\x29\x2b\x09\x0b\x21\x23\x31\x33\x85\x87')
+
+
+class ElfSection:
+    __slots__ = ('name', 'type', 'address', 'offset', 'size', 'link', 'entsize')
+
+    def __init__(self, name, type, address, offset, size, link, entsize):
+        self.name = name
+        self.type = type
+        self.address = address
+        self.offset = offset
+        self.size = size
+        self.link = link
+        self.entsize = entsize
+
+
+def read_elf_functions(binary_path):
+    # Returns (machine, sections, functions) where functions is a list of
+    # (name, address, size, code bytes) from the symbol table, or None if the
+    # file is not an ELF binary with a symbol table.
+    with open(binary_path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'\x7fELF':
+        return None
+    is_64 = data[4] == 2
+    endian = '<' if data[5] == 1 else '>'
+    machine = struct.unpack_from(endian + 'H', data, 18)[0]
+    if is_64:
+        shoff, = struct.unpack_from(endian + 'Q', data, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', data, 0x3A)
+        section_format = endian + 'IIQQQQIIQQ'
+    else:
+        shoff, = struct.unpack_from(endian + 'I', data, 0x20)
+        shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', data, 0x2E)
+        section_format = endian + 'IIIIIIIIII'
+    if not shoff or not shnum:
+        return None
+
+    headers = [struct.unpack_from(section_format, data, shoff + i * shentsize) for i in range(shnum)]
+    names_offset = headers[shstrndx][4]
+    sections = [ElfSection(_c_string(data, names_offset + h[0]), h[1], h[3], h[4], h[5], h[6], h[9])
+                for h in headers]
+
+    symtabs = [s for s in sections if s.type == SHT_SYMTAB] or [s for s in sections if s.type == SHT_DYNSYM]
+    if not symtabs:
+        return None
+    symtab = symtabs[0]
+    strtab = sections[symtab.link]
+    if is_64:
+        symbol_format, symbol_size = endian + 'IBBHQQ', 24
+    else:
+        symbol_format, symbol_size = endian + 'IIIBBH', 16
+
+    functions = []
+    for offset in range(symtab.offset, symtab.offset + symtab.size, symtab.entsize or symbol_size):
+        if is_64:
+            name, info, _, shndx, value, size = struct.unpack_from(symbol_format, data, offset)
+        else:
+            name, value, size, info, _, shndx = struct.unpack_from(symbol_format, data, offset)
+        if info & 0xf != STT_FUNC or not size or not 0 < shndx < len(sections):
+            continue
+        section = sections[shndx]
+        if section.type == SHT_NOBITS:
+            continue
+        start = section.offset + value - section.address
+        functions.append((_c_string(data, strtab.offset + name), value, size, data[start:start + size]))
+    return machine, sections, functions
+
+
+def _c_string(data, offset):
+    return data[offset:data.index(b'\0', offset)].decode('utf-8', 'replace')
+
+
+class AddressResolver:
+    # Turns absolute addresses into names that survive relinking: a function name,
+    # "function+offset", or "section+offset" for data
+    def __init__(self, sections, functions):
+        ordered = sorted((address, size, name) for name, address, size, _ in functions)
+        self.starts = [address for address, _, _ in ordered]
+        self.functions = ordered
+        self.sections = sorted((s.address, s.size, s.name) for s in sections if s.address and s.size)
+        self.section_starts = [address for address, _, _ in self.sections]
+
+    def resolve(self, address):
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0:
+            start, size, name = self.functions[i]
+            if address < start + size:
+                return name if address == start else f"{name}+{address - start}"
+        i = bisect.bisect_right(self.section_starts, address) - 1
+        if i >= 0:
+            start, size, name = self.sections[i]
+            if address < start + size:
+                return f"{name}+{address - start}"
+        return None
+
+
+def normalize_code(code, address, machine, resolver):
+    # Returns (normalized bytes, callees). On x86 the rel32 operand of call/jmp and
+    # RIP-relative displacements change whenever anything before their target moves,
+    # so they are replaced by the symbolic target. Bytes are scanned without a full
+    # decoder: a candidate is only rewritten when its target resolves exactly, which
+    # keeps the hash conservative (a real change is never masked).
+    if machine not in (EM_386, EM_X86_64):
+        return code, []
+    out = bytearray()
+    callees = []
+    i = 0
+    end = len(code)
+    while i < end:
+        opcode = code[i]
+        if opcode in (0xE8, 0xE9) and i + 5 <= end:
+            rel, = struct.unpack_from('<i', code, i + 1)
+            # Calls into .plt resolve to "section+offset", stable as long as the imports are
+            target = resolver.resolve(address + i + 5 + rel)
+            if target is not None:
+                if opcode == 0xE8:
+                    callees.append(target)
+                out += b'\0' + bytes([opcode]) + target.encode() + b'\0'
+                i += 5
+                continue
+        if machine == EM_X86_64:
+            j = i + 1 if 0x40 <= opcode <= 0x4F else i
+            if j + 6 <= end and code[j] in RIP_RELATIVE_OPCODES and code[j + 1] & 0xC7 == 0x05:
+                disp, = struct.unpack_from('<i', code, j + 2)
+                target = resolver.resolve(address + j + 6 + disp)
+                if target is not None:
+                    out += code[i:j + 2] + b'\0' + target.encode() + b'\0'
+                    i = j + 6
+                    continue
+        out.append(opcode)
+        i += 1
+    return bytes(out), callees
+
+
+def fingerprint_binary(binary_path):
+    # name -> [address, size, byte hash, call hash]; None if the binary can't be parsed
+    try:
+        parsed = read_elf_functions(binary_path)
+    except (OSError, struct.error, ValueError, IndexError) as e:
+        logger.warning(f"Could not read symbols of {binary_path}: {e}")
+        return None
+    if parsed is None:
+        return None
+    machine, sections, functions = parsed
+    resolver = AddressResolver(sections, functions)
+    fingerprints = {}
+    for name, address, size, code in functions:
+        normalized, callees = normalize_code(code, address, machine, resolver)
+        byte_hash = hashlib.sha1(normalized).hexdigest()
+        # Stands in for a CFG hash: size plus the functions called, in order
+        call_hash = hashlib.sha1(f"{size}:{','.join(callees)}".encode()).hexdigest()
+        # Static functions can share a name across objects; keep them apart by address
+        key = name if name not in fingerprints else f"{name}@{address:x}"
+        fingerprints[key] = [address, size, byte_hash, call_hash]
+    return fingerprints
+
+
+class ComparisonPlan:
+    # What the fingerprints say about one binary pair: which functions are identical
+    # (reported as MATCH whatever radiff2 says) and which still need a real comparison
+    def __init__(self, fingerprints1, fingerprints2):
+        self.fingerprints1 = fingerprints1
+        self.fingerprints2 = fingerprints2
+        self.unchanged = {name for name, fingerprint in fingerprints1.items()
+                          if name in fingerprints2 and fingerprints2[name][2:] == fingerprint[2:]}
+        self.changed = (set(fingerprints1) | set(fingerprints2)) - self.unchanged
+
+    def comparison_key(self, name):
+        fingerprint1 = self.fingerprints1.get(name)
+        fingerprint2 = self.fingerprints2.get(name)
+        return f"{name}:{fingerprint1[2] if fingerprint1 else '-'}:{fingerprint2[2] if fingerprint2 else '-'}"
+
+    def is_local_match(self, function_name):
+        return clean_function_name(function_name) in self.unchanged
+
+
+class FingerprintStore:
+    # Persistent per-function fingerprints. Fingerprints of each binary are stored by
+    # content hash (consecutive pushes share one side, so one of them is usually a
+    # hit), and the radiff2 rows of changed functions are remembered by fingerprint
+    # pair. radiff2 and Ghidra always work on whole binaries, so work is only saved
+    # when no function changed or every changed function was compared before (a
+    # repeat comparison); otherwise the pair is diffed and decompiled in full and the
+    # fingerprints only keep unchanged functions out of the report.
+
+    def __init__(self, store_dir=FINGERPRINT_STORE_DIR, max_bytes=FINGERPRINT_STORE_MAX_BYTES,
+                 max_comparisons=FINGERPRINT_MAX_COMPARISONS):
+        self.store_dir = Path(store_dir)
+        self.max_bytes = max_bytes
+        self.max_comparisons = max_comparisons
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.comparisons_file = self.store_dir / 'comparisons.json'
+        self._comparisons = None
+
+    def _entry_path(self, key):
+        return self.store_dir / key[:2] / f"{key}.fingerprints.json"
+
+    def fingerprints(self, binary_path):
+        key = file_sha256(binary_path)
+        entry = self._entry_path(key)
+        try:
+            with open(entry) as f:
+                data = json.load(f)
+            if data.get('version') == FINGERPRINT_VERSION:
+                os.utime(entry)
+                return data['functions']
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        fingerprints = fingerprint_binary(binary_path)
+        if fingerprints is not None:
+            self._write_json(entry, {'version': FINGERPRINT_VERSION, 'functions': fingerprints})
+            self.evict()
+        return fingerprints
+
+    def plan(self, binary1, binary2):
+        fingerprints1 = self.fingerprints(binary1)
+        fingerprints2 = self.fingerprints(binary2)
+        if fingerprints1 is None or fingerprints2 is None:
+            return None
+        plan = ComparisonPlan(fingerprints1, fingerprints2)
+        logger.info(f"{os.path.basename(binary1)} -> {os.path.basename(binary2)}: "
+                    f"{len(plan.unchanged)} functions unchanged, {len(plan.changed)} changed")
+        return plan
+
+    @property
+    def comparisons(self):
+        if self._comparisons is None:
+            try:
+                with open(self.comparisons_file) as f:
+                    data = json.load(f)
+                self._comparisons = data['comparisons'] if data.get('version') == FINGERPRINT_VERSION else {}
+            except (FileNotFoundError, ValueError, KeyError):
+                self._comparisons = {}
+        return self._comparisons
+
+    def cached_rows(self, plan):
+        # radiff2 rows for every changed function of binary1, or None if any of
+        # them has not been compared before. A stored None means radiff2 matched it.
+        rows = []
+        for name in sorted(plan.changed & set(plan.fingerprints1)):
+            key = plan.comparison_key(name)
+            if key not in self.comparisons:
+                return None
+            if self.comparisons[key] is not None:
+                rows.append(self.comparisons[key])
+        return rows
+
+    def record(self, plan, radiff_output_file):
+        # Remembers radiff2's verdict for each changed function of binary1
+        rows = {}
+        for record in iter_radiff_records(radiff_output_file):
+            name = clean_function_name(record.function_name)
+            if name in plan.changed:
+                rows[name] = [record.function_name, record.status, record.similarity, record.function_name2]
+        comparisons = self.comparisons
+        for name in plan.changed & set(plan.fingerprints1):
+            key = plan.comparison_key(name)
+            row = rows.get(name)
+            # Re-inserted so the most recently used comparisons are dropped last
+            comparisons.pop(key, None)
+            comparisons[key] = row if row is not None and row[2] < 1.0 else None
+        for key in list(comparisons)[:max(0, len(comparisons) - self.max_comparisons)]:
+            del comparisons[key]
+        self._write_json(self.comparisons_file, {'version': FINGERPRINT_VERSION, 'comparisons': comparisons})
+
+    def write_radiff_output(self, plan, rows, output_file):
+        # Rebuilds radiff2 output from remembered rows, with this pair's addresses and sizes
+        with open(output_file, 'w') as f:
+            for name1, status, similarity, name2 in rows:
+                address1, size1 = plan.fingerprints1[clean_function_name(name1)][:2]
+                fingerprint2 = plan.fingerprints2.get(clean_function_name(name2)) if name2 else None
+                line = f"{name1} {size1} 0x{address1:x} | {status} ({similarity:f})"
+                if fingerprint2:
+                    line += f" | 0x{fingerprint2[0]:x} {fingerprint2[1]} {name2}"
+                f.write(line + "\n")
+
+    def _write_json(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write fingerprint store entry {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self.store_dir.glob('*/*.fingerprints.json'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Lines written by Ghidra/the JVM around the decompiled C (log records, SLF4J noise,
+# JVM warnings), optionally prefixed with ANSI colour codes
+LOG_LINE = re.compile(rb'^(?:\x1b\[[0-9;]*m)*(?:INFO |DEBUG |WARN |ERROR |SLF4J:|WARNING:)')
+# Last log line before DecompileHeadless starts printing C
+SCRIPT_MARKER = re.compile(rb'^INFO  SCRIPT: .*DecompileHeadless')
+# Identifier right before the parameter list of a function signature
+SIGNATURE_NAME = re.compile(rb'([A-Za-z_~][\w:~<>]*)\s*$')
+NON_SIGNATURE_PREFIXES = (b'typedef', b'struct', b'union', b'enum', b'//', b'#')
+
+INDEX_VERSION = 1
+
+
+def clean_function_name(function_name):
+    # radiff2 names carry flag-space prefixes (sym., sym.imp., dbg.) that Ghidra does not print
+    for prefix in ('dbg.', 'sym.imp.', 'sym.', 'imp.'):
+        if function_name.startswith(prefix):
+            return function_name[len(prefix):]
+    return function_name
+
+
+def signature_name(line):
+    # Ghidra prints each signature on one line at column 0, e.g. "undefined8 main(void)"
+    if not line or line[:1].isspace() or line.startswith(NON_SIGNATURE_PREFIXES):
+        return None
+    stripped = line.rstrip()
+    paren = stripped.find(b'(')
+    if paren <= 0 or not stripped.endswith(b')'):
+        return None
+    match = SIGNATURE_NAME.search(stripped[:paren])
+    if not match:
+        return None
+    return match.group(1).decode('utf-8', 'replace')
+
+
+class FunctionIndexBuilder:
+    # Incremental single-pass parser: feed it the decompiled output line by line (as
+    # bytes) and it records name -> (start, end) byte spans of every function, from
+    # the signature line to the closing brace at column 0.
+
+    def __init__(self):
+        self.functions = {}
+        self.body_start = 0
+        self.offset = 0
+        self._candidate = None  # (start offset, name) of the last signature line
+        self._current = None    # function currently being read
+
+    def feed(self, line):
+        start = self.offset
+        self.offset += len(line)
+        content = line.rstrip(b'\r\n')
+
+        if LOG_LINE.match(content):
+            if SCRIPT_MARKER.match(content):
+                # Everything before this line is the Ghidra/JVM preamble
+                self.body_start = self.offset
+                self.functions.clear()
+            self._candidate = None
+            self._current = None
+            return
+
+        if self._current is not None:
+            if content.startswith(b'}'):
+                function_start, name = self._current
+                self.functions.setdefault(name, (function_start, start + len(content)))
+                self._current = None
+            return
+
+        if not content.strip():
+            return
+        if content == b'{' and self._candidate is not None:
+            self._current = self._candidate
+            self._candidate = None
+            return
+        name = signature_name(content)
+        self._candidate = (start, name) if name else None
+
+    def finish(self):
+        return self.functions
+
+
+def index_path_for(decompiled_file):
+    base = decompiled_file[:-4] if decompiled_file.endswith('.txt') else decompiled_file
+    return f"{base}.index.json"
+
+
+class FunctionIndex:
+    # Name -> byte span of every function body in a .decompiled.txt file. Persisted as
+    # <name>.decompiled.index.json next to the output and rebuilt when the file changes.
+
+    def __init__(self, decompiled_file, functions, body_start=0):
+        self.decompiled_file = decompiled_file
+        self.functions = functions
+        self.body_start = body_start
+
+    @classmethod
+    def build(cls, decompiled_file):
+        builder = FunctionIndexBuilder()
+        with open(decompiled_file, 'rb') as f:
+            for line in f:
+                builder.feed(line)
+        return cls(decompiled_file, builder.finish(), builder.body_start)
+
+    @classmethod
+    def load_or_build(cls, decompiled_file):
+        stat = os.stat(decompiled_file)
+        index_file = index_path_for(decompiled_file)
+        try:
+            with open(index_file) as f:
+                data = json.load(f)
+            if (data.get('version') == INDEX_VERSION and data.get('size') == stat.st_size
+                    and data.get('mtime_ns') == stat.st_mtime_ns):
+                functions = {name: tuple(span) for name, span in data['functions'].items()}
+                return cls(decompiled_file, functions, data.get('body_start', 0))
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        index = cls.build(decompiled_file)
+        index.save(stat)
+        return index
+
+    def save(self, stat=None):
+        stat = stat or os.stat(self.decompiled_file)
+        data = {
+            'version': INDEX_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'body_start': self.body_start,
+            'functions': self.functions,
+        }
+        index_file = index_path_for(self.decompiled_file)
+        tmp_file = f"{index_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, index_file)
+        except OSError as e:
+            logger.warning(f"Could not persist function index {index_file}: {e}")
+
+    def span(self, function_name):
+        return self.functions.get(clean_function_name(function_name))
+
+    def read(self, function_name, f=None):
+        # Returns the function's code, or None when it is not in the index. Pass an
+        # open binary file handle to avoid reopening the file for every lookup.
+        span = self.span(function_name)
+        if span is None:
+            return None
+        if f is None:
+            with open(self.decompiled_file, 'rb') as f:
+                return read_span(f, span)
+        return read_span(f, span)
+
+
+def read_span(f, span):
+    start, end = span
+    f.seek(start)
+    return f.read(end - start).decode('utf-8', 'replace')
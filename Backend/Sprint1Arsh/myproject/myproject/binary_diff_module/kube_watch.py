@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+# Recent waits kept per watcher; the intake loop runs indefinitely
+WAIT_HISTORY_SIZE = 1000
+
+
+class ResourceWatcher:
+    # Keeps one watch stream open per resource kind and namespace, and lets any
+    # number of callers block until an object reaches a state they care about.
+    # The latest version of every object seen on the stream is cached, so a
+    # caller that arrives after the transition still returns immediately.
+
+    def __init__(self, list_func, kind, namespace='default', label_selector=None, stream_timeout=300):
+        self.list_func = list_func
+        self.kind = kind
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.stream_timeout = stream_timeout
+        self.wait_times = deque(maxlen=WAIT_HISTORY_SIZE)  # (name, seconds waited, outcome)
+        self._objects = {}
+        self._resource_version = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._watch = None
+        self._stopped = False
+
+    def _list_kwargs(self):
+        kwargs = {'namespace': self.namespace}
+        if self.label_selector:
+            kwargs['label_selector'] = self.label_selector
+        return kwargs
+
+    def start(self, resource_version=None):
+        # The first caller decides where the stream starts. Passing the resourceVersion
+        # returned by a create call avoids missing events between the create and the watch;
+        # without one the watcher lists the current objects first.
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._resource_version = resource_version
+            self._thread = threading.Thread(target=self._run, name=f'{self.kind}-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        if self._watch is not None:
+            self._watch.stop()
+
+    def _relist(self):
+        listing = self.list_func(**self._list_kwargs())
+        with self._cond:
+            self._objects = {item.metadata.name: item for item in listing.items}
+            self._resource_version = listing.metadata.resource_version
+            self._cond.notify_all()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                if self._resource_version is None:
+                    self._relist()
+                self._watch = watch.Watch()
+                for event in self._watch.stream(self.list_func, resource_version=self._resource_version,
+                                                timeout_seconds=self.stream_timeout, **self._list_kwargs()):
+                    obj = event['object']
+                    with self._cond:
+                        self._resource_version = obj.metadata.resource_version
+                        if event['type'] == 'DELETED':
+                            self._objects.pop(obj.metadata.name, None)
+                        else:
+                            self._objects[obj.metadata.name] = obj
+                        self._cond.notify_all()
+            except ApiException as e:
+                if e.status == 410:
+                    # Our resourceVersion is too old for the API server; start again from a fresh list
+                    logger.info(f"{self.kind} watch expired, relisting.")
+                    self._resource_version = None
+                else:
+                    logger.error(f"Error watching {self.kind} objects: {e}")
+                    time.sleep(1)
+            except Exception as e:
+                logger.error(f"{self.kind} watch stream dropped: {e}")
+                time.sleep(1)
+
+    def _state(self, name, classify):
+        obj = self._objects.get(name)
+        # Objects that are being deleted belong to an earlier run with the same name
+        if obj is None or obj.metadata.deletion_timestamp is not None:
+            return None
+        return classify(obj)
+
+    def wait(self, name, classify, timeout, resource_version=None):
+        # Blocks until classify(obj) returns something other than None, or the timeout
+        # expires. Returns (outcome, seconds waited); outcome is None on timeout.
+        self.start(resource_version)
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            outcome = self._state(name, classify)
+            while outcome is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                outcome = self._state(name, classify)
+        elapsed = time.monotonic() - started
+        self.record_wait(name, elapsed, outcome)
+        return outcome, elapsed
+
+    def wait_any(self, names, classify, timeout, resource_version=None):
+        # Like wait(), but returns (name, outcome) for the first of several objects to
+        # settle, or None when none of them did before the timeout.
+        self.start(resource_version)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for name in names:
+                    outcome = self._state(name, classify)
+                    if outcome is not None:
+                        return name, outcome
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def record_wait(self, name, seconds, outcome):
+        self.wait_times.append((name, seconds, outcome))
+        logger.info(f"Waited {seconds:.2f}s for {self.kind} {name} (outcome: {outcome}).")
@@ -0,0 +1,586 @@
+import hashlib
+import os
+import re
+import subprocess
+import time
+import logging
+
+import urllib3
+import yaml
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+
+from executors import Executor, GHIDRA_IMAGE
+from function_index import LOG_LINE, SCRIPT_MARKER, FunctionIndex, FunctionIndexBuilder
+from kube_watch import ResourceWatcher
+from tracing import add_span, span
+from transfer_client import TransferClient, TransferError
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on Ghidra Jobs running in the cluster at the same time
+GHIDRA_MAX_CONCURRENT_JOBS = int(os.getenv("GHIDRA_MAX_CONCURRENT_JOBS", "4"))
+# Same for the per-pair radiff Jobs
+RADIFF_MAX_CONCURRENT_JOBS = int(os.getenv("RADIFF_MAX_CONCURRENT_JOBS", "4"))
+RADIFF_IMAGE = os.getenv("RADIFF_IMAGE", "radare/radare2:latest")
+# Transfer sidecar on input-output-pvc. Without TRANSFER_URL a kubectl port-forward
+# to the sidecar Service is started once and kept open for the life of the process.
+TRANSFER_URL = os.getenv("TRANSFER_URL")
+TRANSFER_LOCAL_PORT = int(os.getenv("TRANSFER_LOCAL_PORT", "18080"))
+# Shared secret the sidecar requires on every transfer; stored in the pvc-transfer-token
+# Secret the sidecar reads it from
+TRANSFER_TOKEN = os.getenv("TRANSFER_TOKEN")
+TRANSFER_MANIFEST = '/app/kubernetes/transfer-sidecar.yaml'
+# Ghidra logs are streamed to disk in chunks of this size instead of loaded whole
+LOG_CHUNK_SIZE = int(os.getenv("LOG_CHUNK_SIZE", str(1024 * 1024)))
+LOG_MAX_RETRIES = int(os.getenv("LOG_MAX_RETRIES", "5"))
+# (connect, read) timeouts; a stalled stream counts as a dropped connection
+LOG_REQUEST_TIMEOUT = (10, 120)
+
+class JobSubmitError(Exception):
+    pass
+
+class JobExistsError(JobSubmitError):
+    pass
+
+# Kubernetes API clients, created once and shared by every call in the process
+_api_client = None
+
+def get_api_client():
+    global _api_client
+    if _api_client is None:
+        config.load_kube_config()
+        _api_client = client.ApiClient()
+    return _api_client
+
+def get_batch_v1():
+    return client.BatchV1Api(get_api_client())
+
+def get_core_v1():
+    return client.CoreV1Api(get_api_client())
+
+def get_apps_v1():
+    return client.AppsV1Api(get_api_client())
+
+# Shared watch streams for job completion and deployment readiness, started on first use
+_job_watcher = None
+_deployment_watcher = None
+
+def get_job_watcher():
+    global _job_watcher
+    if _job_watcher is None:
+        _job_watcher = ResourceWatcher(get_batch_v1().list_namespaced_job, 'job')
+    return _job_watcher
+
+def get_deployment_watcher():
+    global _deployment_watcher
+    if _deployment_watcher is None:
+        _deployment_watcher = ResourceWatcher(get_apps_v1().list_namespaced_deployment, 'deployment')
+    return _deployment_watcher
+
+def job_completion_state(job):
+    if job.status.succeeded and job.status.succeeded >= 1:
+        return True
+    elif job.status.failed and job.status.failed >= 1:
+        return False
+    return None
+
+def deployment_available_state(deployment):
+    if deployment.status.available_replicas and deployment.status.available_replicas >= 1:
+        return True
+    return None
+
+# Long-lived transfer endpoint, shared by every run in the process
+_transfer_client = None
+_port_forward = None
+
+def ensure_transfer_sidecar(timeout=300):
+    with span('k8s.ensure_transfer_sidecar'):
+        return _ensure_transfer_sidecar(timeout)
+
+def _ensure_transfer_sidecar(timeout):
+    # Creates the sidecar Deployment and Service if they are missing and waits until
+    # the Deployment has an available replica. Existing objects are left as they are.
+    if not TRANSFER_TOKEN:
+        logger.error("TRANSFER_TOKEN is not set; the pvc-transfer sidecar refuses unauthenticated transfers.")
+        return False
+    try:
+        get_core_v1().create_namespaced_secret(namespace='default', body=client.V1Secret(
+            metadata=client.V1ObjectMeta(name='pvc-transfer-token'), string_data={'token': TRANSFER_TOKEN}))
+        logger.info("Secret pvc-transfer-token created.")
+    except ApiException as e:
+        if e.status != 409:
+            logger.error(f"Error creating Secret pvc-transfer-token: {e}")
+            return False
+    resource_version = None
+    with open(TRANSFER_MANIFEST) as f:
+        manifests = [doc for doc in yaml.safe_load_all(f) if doc]
+    for manifest in manifests:
+        name = manifest['metadata']['name']
+        try:
+            if manifest['kind'] == 'Deployment':
+                deployment = get_apps_v1().create_namespaced_deployment(body=manifest, namespace='default')
+                resource_version = deployment.metadata.resource_version
+            elif manifest['kind'] == 'Service':
+                get_core_v1().create_namespaced_service(body=manifest, namespace='default')
+            logger.info(f"{manifest['kind']} {name} created.")
+        except ApiException as e:
+            if e.status != 409:
+                logger.error(f"Error creating {manifest['kind']} {name}: {e}")
+                return False
+    available, elapsed = get_deployment_watcher().wait('pvc-transfer', deployment_available_state,
+                                                       timeout, resource_version)
+    if not available:
+        logger.error("Timeout waiting for the pvc-transfer sidecar to become available.")
+        return False
+    logger.info(f"pvc-transfer sidecar available after {elapsed:.2f}s.")
+    return True
+
+def get_transfer_client():
+    global _transfer_client, _port_forward
+    # Reuse the open connection unless the port-forward behind it has exited
+    if _transfer_client is not None and (_port_forward is None or _port_forward.poll() is None):
+        return _transfer_client
+    if not ensure_transfer_sidecar():
+        return None
+    url = TRANSFER_URL
+    if not url:
+        if _port_forward is None or _port_forward.poll() is not None:
+            _port_forward = subprocess.Popen(
+                ['kubectl', 'port-forward', 'service/pvc-transfer', f'{TRANSFER_LOCAL_PORT}:8080'],
+                stdout=subprocess.DEVNULL)
+        url = f'http://127.0.0.1:{TRANSFER_LOCAL_PORT}'
+    transfer = TransferClient(url, TRANSFER_TOKEN)
+    with span('transfer.connect', url=url):
+        if not transfer.wait_until_ready():
+            return None
+    _transfer_client = transfer
+    return _transfer_client
+
+def new_batch_id():
+    return os.urandom(3).hex()
+
+def job_name_for(prefix, name, batch_id=None):
+    # Kubernetes object names must be lowercase DNS labels of at most 63 characters.
+    # The batch id keeps a batch's Jobs apart from same-named Jobs of an earlier batch
+    # that may still be terminating or were never cleaned up.
+    slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+    suffix = f'-{batch_id}' if batch_id else ''
+    job_name = f'{prefix}-{slug}'
+    if len(job_name) + len(suffix) > 63:
+        digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+        job_name = f'{job_name[:54 - len(suffix)].rstrip("-")}-{digest}'
+    return job_name + suffix
+
+def run_jobs(jobs, on_success=None, timeout=600, max_concurrent=GHIDRA_MAX_CONCURRENT_JOBS):
+    # Submits the given Jobs (job name -> manifest path), at most max_concurrent at a
+    # time, and tracks all of them through the shared job watch stream. on_success is
+    # called with the job name before the Job is deleted (e.g. to fetch its logs).
+    # Returns the names of the jobs that succeeded and whose on_success returned True.
+    job_watcher = get_job_watcher()
+    queued = list(jobs.items())
+    running = {}  # job name -> submission time
+    submitted = {}  # job name -> wall-clock submission time, for the trace
+    succeeded = set()
+
+    def submit_next():
+        while queued and len(running) < max_concurrent:
+            job_name, job_yaml = queued.pop(0)
+            try:
+                resource_version = submit_kubernetes_job(job_yaml)
+            except JobExistsError:
+                # Not ours: reading its logs would attribute another run's output to this one
+                logger.error(f"Job {job_name} already exists, skipping it.")
+                continue
+            except JobSubmitError as e:
+                # Counted as failed; the rest of the batch goes on
+                logger.error(f"Job {job_name} could not be submitted, skipping it: {e}")
+                continue
+            job_watcher.start(resource_version)
+            running[job_name] = time.monotonic()
+            submitted[job_name] = time.time()
+
+    def finish(job_name, completed):
+        submitted_at = running.pop(job_name)
+        job_watcher.record_wait(job_name, time.monotonic() - submitted_at, completed)
+        add_span('k8s.job', submitted[job_name], time.time(), 'ok' if completed else 'error',
+                 job=job_name, outcome={True: 'succeeded', False: 'failed', None: 'timeout'}[completed])
+        record_pod_timings(job_name)
+        if completed:
+            logger.info(f"Job {job_name} completed successfully.")
+            if on_success is None or on_success(job_name):
+                succeeded.add(job_name)
+        else:
+            logger.error(f"Job {job_name} failed or timed out.")
+        delete_job(job_name)
+        submit_next()
+
+    submit_next()
+    while running:
+        # Expire jobs that have been running for longer than the timeout
+        now = time.monotonic()
+        for job_name, submitted_at in list(running.items()):
+            if now - submitted_at >= timeout:
+                finish(job_name, False)
+        if not running:
+            break
+
+        remaining = min(running.values()) + timeout - now
+        settled = job_watcher.wait_any(list(running), job_completion_state, remaining)
+        if settled is not None:
+            finish(*settled)
+
+    return succeeded
+
+def run_ghidra_jobs(binary_names, output_dir, timeout=600, max_concurrent=GHIDRA_MAX_CONCURRENT_JOBS):
+    # One Ghidra Job per binary. Returns binary name -> decompiled file for every job
+    # whose logs were retrieved.
+    jobs = {}
+    outputs = {}
+    batch_id = new_batch_id()
+    for binary_name in binary_names:
+        job_name = job_name_for('ghidra-decompiler-job', binary_name, batch_id)
+        job_yaml = f'kubernetes/{job_name_for("ghidra-job", binary_name)}.yaml'
+        create_ghidra_job_yaml(binary_name, job_name, job_yaml)
+        jobs[job_name] = job_yaml
+        outputs[job_name] = (binary_name, os.path.join(output_dir, f'{binary_name}.decompiled.txt'))
+
+    def fetch_logs(job_name):
+        if get_job_logs(job_name, outputs[job_name][1]):
+            return True
+        logger.error(f"Failed to retrieve logs for job {job_name}")
+        return False
+
+    succeeded = run_jobs(jobs, fetch_logs, timeout, max_concurrent)
+    return dict(outputs[job_name] for job_name in succeeded)
+
+def run_radiff_jobs(pairs, timeout=600, max_concurrent=RADIFF_MAX_CONCURRENT_JOBS):
+    # One radiff Job per (binary1 name, binary2 name, output name) triple; the output is
+    # written to output/<output name> on the PVC. Returns the output names that succeeded.
+    jobs = {}
+    outputs = {}
+    batch_id = new_batch_id()
+    for binary1_name, binary2_name, output_name in pairs:
+        job_name = job_name_for('radiff-analysis-job', output_name, batch_id)
+        job_yaml = f'kubernetes/{job_name_for("radiff-job", output_name)}.yaml'
+        create_radiff_job_yaml(binary1_name, binary2_name, output_name, job_name, job_yaml)
+        jobs[job_name] = job_yaml
+        outputs[job_name] = output_name
+
+    succeeded = run_jobs(jobs, None, timeout, max_concurrent)
+    return [outputs[job_name] for job_name in succeeded]
+
+def record_pod_timings(job_name):
+    # Splits a Job's time into scheduling, startup (image pull, volume mount) and run
+    # time using the timestamps Kubernetes keeps on the pod
+    try:
+        pods = get_core_v1().list_namespaced_pod(namespace='default', label_selector=f'job-name={job_name}')
+    except ApiException as e:
+        logger.warning(f"Could not read pod timings for job {job_name}: {e}")
+        return
+    for pod in pods.items:
+        created = pod.metadata.creation_timestamp
+        scheduled = next((c.last_transition_time for c in pod.status.conditions or []
+                          if c.type == 'PodScheduled' and c.status == 'True'), None)
+        state = pod.status.container_statuses[0].state if pod.status.container_statuses else None
+        started = finished = None
+        if state is not None and state.terminated is not None:
+            started, finished = state.terminated.started_at, state.terminated.finished_at
+        elif state is not None and state.running is not None:
+            started = state.running.started_at
+        pod_name = pod.metadata.name
+        if created and scheduled:
+            add_span('k8s.pod_scheduling', created.timestamp(), scheduled.timestamp(), job=job_name, pod=pod_name)
+        if scheduled and started:
+            add_span('k8s.pod_startup', scheduled.timestamp(), started.timestamp(), job=job_name, pod=pod_name)
+        if started and finished:
+            add_span('k8s.container_run', started.timestamp(), finished.timestamp(), job=job_name, pod=pod_name,
+                     exit_code=state.terminated.exit_code)
+
+def submit_kubernetes_job(job_manifest_path):
+    with span('k8s.create_job', manifest=job_manifest_path):
+        return _submit_kubernetes_job(job_manifest_path)
+
+def _submit_kubernetes_job(job_manifest_path):
+    try:
+        batch_v1 = get_batch_v1()
+        with open(job_manifest_path) as f:
+            job_manifest = yaml.safe_load(f)
+        job_name = job_manifest['metadata']['name']
+        job = batch_v1.create_namespaced_job(
+            body=job_manifest,
+            namespace='default')
+        logger.info(f"Job {job_name} submitted.")
+        return job.metadata.resource_version
+    except ApiException as e:
+        if e.status == 409:
+            raise JobExistsError(job_name)
+        raise JobSubmitError(f"{e.status} {e.reason}") from e
+
+def delete_job(job_name):
+    with span('k8s.delete_job', job=job_name):
+        _delete_job(job_name)
+
+def _delete_job(job_name):
+    try:
+        batch_v1 = get_batch_v1()
+        batch_v1.delete_namespaced_job(
+            name=job_name,
+            namespace='default',
+            body=client.V1DeleteOptions(propagation_policy='Foreground'))
+        logger.info(f"Job {job_name} deleted.")
+    except ApiException as e:
+        logger.error(f"Error deleting job {job_name}: {e}")
+
+def get_job_logs(job_name, output_file):
+    with span('k8s.get_logs', job=job_name):
+        return _get_job_logs(job_name, output_file)
+
+def _get_job_logs(job_name, output_file):
+    core_v1 = get_core_v1()
+    label_selector = f'job-name={job_name}'
+    pods = core_v1.list_namespaced_pod(namespace='default', label_selector=label_selector)
+    if not pods.items:
+        logger.error(f"No pods found for job {job_name}")
+        return False
+    pod_name = pods.items[0].metadata.name
+
+    # The Job has finished, so its log no longer changes. The log API has no offset
+    # parameter: after a dropped connection the stream is reopened and the bytes that
+    # were already consumed are skipped.
+    tmp_file = f"{output_file}.part"
+    log_filter = DecompiledLogWriter()
+    consumed = 0
+    attempts = 0
+    try:
+        with open(tmp_file, 'wb') as out:
+            while True:
+                skip = consumed
+                try:
+                    response = core_v1.read_namespaced_pod_log(name=pod_name, namespace='default',
+                                                               _preload_content=False,
+                                                               _request_timeout=LOG_REQUEST_TIMEOUT)
+                    try:
+                        for chunk in response.stream(LOG_CHUNK_SIZE):
+                            if skip:
+                                if len(chunk) <= skip:
+                                    skip -= len(chunk)
+                                    continue
+                                chunk, skip = chunk[skip:], 0
+                            log_filter.write(out, chunk)
+                            consumed += len(chunk)
+                    finally:
+                        response.release_conn()
+                    break
+                except (ApiException, urllib3.exceptions.HTTPError) as e:
+                    attempts += 1
+                    if attempts > LOG_MAX_RETRIES:
+                        logger.error(f"Giving up on logs of job {job_name} after {consumed} bytes: {e}")
+                        return False
+                    logger.warning(f"Log stream of job {job_name} dropped at byte {consumed}, resuming: {e}")
+                    time.sleep(min(2 ** attempts, 30))
+            log_filter.close(out)
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+
+    # The index was built while streaming, so the report never rescans this file
+    FunctionIndex(output_file, log_filter.index.finish()).save()
+    logger.info(f"Saved decompiled output from job {job_name} to {output_file} "
+                f"({consumed} bytes streamed, {log_filter.dropped} log lines dropped, "
+                f"{len(log_filter.index.functions)} functions indexed)")
+    return True
+
+class DecompiledLogWriter:
+    # Writes the decompiler's C output from a stream of log chunks, line by line:
+    # the preamble before the DecompileHeadless marker and Ghidra/JVM log lines are
+    # dropped, and every kept line is fed to a function index whose offsets therefore
+    # match the written file
+    def __init__(self):
+        self.index = FunctionIndexBuilder()
+        self.dropped = 0
+        self._partial = b''
+
+    def write(self, out, chunk):
+        lines = (self._partial + chunk).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._write_line(out, line + b'\n')
+
+    def close(self, out):
+        if self._partial:
+            self._write_line(out, self._partial)
+            self._partial = b''
+
+    def _write_line(self, out, line):
+        if LOG_LINE.match(line):
+            if SCRIPT_MARKER.match(line):
+                # Everything so far was Ghidra/JVM preamble: start the file over
+                out.seek(0)
+                out.truncate()
+                self.index = FunctionIndexBuilder()
+            self.dropped += 1
+            return
+        self.index.feed(line)
+        out.write(line)
+
+def create_ghidra_job_yaml(binary_name, job_name, job_yaml_path):
+    ghidra_job_manifest = {
+        "apiVersion": "batch/v1",
+        "kind": "Job",
+        "metadata": {
+            "name": job_name,
+            "labels": {
+                "app": "ghidra-decompiler"
+            }
+        },
+        "spec": {
+            "template": {
+                "metadata": {
+                    "labels": {
+                        "app": "ghidra-decompiler"
+                    }
+                },
+                "spec": {
+                    "containers": [
+                        {
+                            "name": "ghidra-decompiler",
+                            "image": GHIDRA_IMAGE,
+                            "args": [
+                                "decompile",
+                                f"/app/input_binaries/{binary_name}"
+                            ],
+                            "volumeMounts": [
+                                {
+                                    "name": "input-output-storage",
+                                    "mountPath": "/app/input_binaries",
+                                    "subPath": "input_binaries"
+                                }
+                            ]
+                        }
+                    ],
+                    "restartPolicy": "Never",
+                    "volumes": [
+                        {
+                            "name": "input-output-storage",
+                            "persistentVolumeClaim": {
+                                "claimName": "input-output-pvc"
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+    }
+    with open(job_yaml_path, 'w') as f:
+        yaml.dump(ghidra_job_manifest, f)
+
+
+def create_radiff_job_yaml(binary1_name, binary2_name, output_name, job_name, job_yaml_path):
+    radiff_job_manifest = {
+        "apiVersion": "batch/v1",
+        "kind": "Job",
+        "metadata": {
+            "name": job_name,
+            "labels": {
+                "app": "radiff"
+            }
+        },
+        "spec": {
+            "template": {
+                "metadata": {
+                    "labels": {
+                        "app": "radiff"
+                    }
+                },
+                "spec": {
+                    "containers": [
+                        {
+                            "name": "radiff",
+                            "image": RADIFF_IMAGE,
+                            "command": [
+                                "/bin/sh",
+                                "-c",
+                                f"radiff2 -A -C /app/input_binaries/{binary1_name} /app/input_binaries/{binary2_name} "
+                                f"> /output/{output_name}"
+                            ],
+                            "volumeMounts": [
+                                {
+                                    "name": "input-output-storage",
+                                    "mountPath": "/app/input_binaries",
+                                    "subPath": "input_binaries"
+                                },
+                                {
+                                    "name": "input-output-storage",
+                                    "mountPath": "/output",
+                                    "subPath": "output"
+                                }
+                            ]
+                        }
+                    ],
+                    "restartPolicy": "Never",
+                    "volumes": [
+                        {
+                            "name": "input-output-storage",
+                            "persistentVolumeClaim": {
+                                "claimName": "input-output-pvc"
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+    }
+    with open(job_yaml_path, 'w') as f:
+        yaml.dump(radiff_job_manifest, f)
+
+class KubernetesExecutor(Executor):
+    # Runs Ghidra and radiff2 as Jobs on the cluster. Files move in and out of
+    # input-output-pvc through the pvc-transfer sidecar.
+
+    def __init__(self):
+        self.transfer = None
+
+    def upload_binaries(self, binaries):
+        self.transfer = get_transfer_client()
+        if self.transfer is None:
+            return False
+        try:
+            with span('transfer.upload', files=len(binaries)):
+                self.transfer.upload([(binary, f'input_binaries/{os.path.basename(binary)}') for binary in binaries])
+        except (TransferError, OSError) as e:
+            logger.error(f"Error uploading binaries to the PVC: {e}")
+            return False
+        return True
+
+    def decompile(self, binaries, output_dir):
+        return run_ghidra_jobs([os.path.basename(binary) for binary in binaries], output_dir)
+
+    def store_decompiled(self, decompiled_files):
+        try:
+            with span('transfer.upload', files=len(decompiled_files)):
+                self.transfer.upload([(decompiled_file, f'output/{os.path.basename(decompiled_file)}')
+                                      for decompiled_file in decompiled_files])
+        except (TransferError, OSError) as e:
+            logger.error(f"Error uploading decompiled files to the PVC: {e}")
+
+    def radiff(self, binary1, binary2, output_file):
+        return self.radiff_pairs([(binary1, binary2, output_file)])[output_file]
+
+    def radiff_pairs(self, pairs):
+        # Runs one radiff Job per pair concurrently, then downloads every output in one batch
+        local_outputs = {os.path.basename(output_file): output_file for _, _, output_file in pairs}
+        succeeded = run_radiff_jobs([
+            (os.path.basename(binary1), os.path.basename(binary2), os.path.basename(output_file))
+            for binary1, binary2, output_file in pairs
+        ])
+        if succeeded:
+            try:
+                with span('transfer.download', files=len(succeeded)):
+                    self.transfer.download([(f'output/{name}', local_outputs[name]) for name in succeeded])
+                logger.info(f"Copied {len(succeeded)} radiff output(s) from the PVC")
+            except (TransferError, OSError) as e:
+                logger.error(f"Failed to copy radiff output from the PVC: {e}")
+                succeeded = []
+        return {output_file: name in succeeded for name, output_file in local_outputs.items()}
@@ -1,15 +1,18 @@
-import subprocess
-import re
+import functools
 import os
-import sys
-import time
-import yaml
-import glob
 import shutil
 from pathlib import Path
 
-from kubernetes import client, config
-from kubernetes.client.rest import ApiException
+from batch_intake import BatchIntake
+from compile_cache import compile_all
+from decompile_cache import DecompileCache
+from executors import GHIDRA_IMAGE, get_executor
+from fingerprint_store import FingerprintStore
+from radiff_parser import iter_function_differences
+from function_index import FunctionIndexBuilder, clean_function_name
+from report_writer import JsonlReportWriter, function_not_found, render_text_report
+import tracing
+from tracing import span
 
 # Configure logging
 import logging
@@ -17,369 +20,209 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
-def extract_function_differences(radiff_output_file):
-    differences = []
-    with open(radiff_output_file, 'r') as f:
-        for line in f:
-            pattern = r'^(\S+)\s+(\d+)\s+(\S+)\s+\|\s+(\S+)\s+\(([\d\.]+)\)\s+\|\s+(\S+)\s+(\d+)\s+(\S+)$'
-            match = re.match(pattern, line.strip())
-            if match:
-                func_name1 = match.group(1)
-                size1 = int(match.group(2))
-                addr1 = match.group(3)
-                status = match.group(4)
-                similarity = float(match.group(5))
-                addr2 = match.group(6)
-                size2 = int(match.group(7))
-                func_name2 = match.group(8)
-
-                if similarity < 1.0:
-                    differences.append({
-                        'function_name': func_name1,
-                        'similarity': similarity,
-                        'address1': addr1,
-                        'size1': size1,
-                        'address2': addr2,
-                        'size2': size2
-                    })
-    return differences
-
-def compile_and_analyze():
-    c_source1 = "/shared/c_source/version1/main.c"
-    c_source2 = "/shared/c_source/version2/main.c"
-    binary_dir = "/shared/input_binaries"
-    output_dir = "/shared/output"
+def extract_function_differences(radiff_output_file, plan=None):
+    # With a fingerprint plan, functions whose fingerprints are identical are MATCH
+    # regardless of what radiff2 reported for them
+    return [record.as_dict() for record in iter_function_differences(radiff_output_file)
+            if plan is None or not plan.is_local_match(record.function_name)]
+
+class SourcePair:
+    # Both versions of one C source file in a push, and the files derived from them
+    def __init__(self, name, source1, source2, binary_dir, output_dir):
+        stem = os.path.splitext(name)[0]
+        self.name = name
+        self.source1 = source1
+        self.source2 = source2
+        self.binary1 = os.path.join(binary_dir, f"{stem}.v1.bin")
+        self.binary2 = os.path.join(binary_dir, f"{stem}.v2.bin")
+        self.decompiled1 = os.path.join(output_dir, f"{stem}.v1.bin.decompiled.txt")
+        self.decompiled2 = os.path.join(output_dir, f"{stem}.v2.bin.decompiled.txt")
+        self.radiff_output = os.path.join(output_dir, f"{stem}.radiff_output.txt")
+        self.status = None
+        self.plan = None
+        self.radiff_cached = False
+
+def discover_source_pairs(version1_dir, version2_dir, binary_dir, output_dir):
+    # Pairs files by name across the two version directories. The receiver writes an
+    # empty file for the side where a source did not exist, so empty means missing.
+    def sources(directory):
+        return {path.name: str(path) for path in Path(directory).glob("*.c") if path.stat().st_size > 0}
+
+    sources1 = sources(version1_dir)
+    sources2 = sources(version2_dir)
+    return [SourcePair(name, sources1.get(name), sources2.get(name), binary_dir, output_dir)
+            for name in sorted(set(sources1) | set(sources2))]
+
+def decompile_binaries(executor, binaries, output_dir):
+    # Returns binary path -> decompiled file, from the cache where possible
+    decompile_cache = DecompileCache()
+    decompiled = {}
+    cache_keys = {}
+    with span('decompile.cache_lookup', binaries=len(binaries)) as lookup:
+        for binary in binaries:
+            binary_name = os.path.basename(binary)
+            decompiled_output_file = os.path.join(output_dir, f'{binary_name}.decompiled.txt')
+
+            # Reuse the stored output when these exact bytes were already decompiled
+            cache_key = decompile_cache.key_for(binary, GHIDRA_IMAGE)
+            if decompile_cache.get(cache_key, decompiled_output_file):
+                decompiled[binary] = decompiled_output_file
+            else:
+                cache_keys[binary] = cache_key
+        lookup.set(hits=len(decompiled), misses=len(cache_keys))
+
+    # Decompile the remaining binaries of the whole push concurrently
+    binary_paths = {os.path.basename(binary): binary for binary in cache_keys}
+    with span('decompile.run', binaries=len(cache_keys)):
+        results = executor.decompile(list(cache_keys), output_dir)
+    for binary_name, decompiled_output_file in results.items():
+        binary = binary_paths[binary_name]
+        decompiled[binary] = decompiled_output_file
+        decompile_cache.put(cache_keys[binary], decompiled_output_file)
+    with span('decompile.store', files=len(decompiled)):
+        executor.store_decompiled(list(decompiled.values()))
+    return decompiled
+
+def compile_and_analyze(source_dir="/shared/c_source", binary_dir="/shared/input_binaries", output_dir="/shared/output",
+                        batch_id=None):
+    # A batch gets its own binary_dir/<batch_id>/ and output_dir/<batch_id>/, so one
+    # push never overwrites the binaries, decompiled files or report of another.
+    # Returns the path of the report, or None when none was written.
+    if batch_id is not None:
+        binary_dir = os.path.join(binary_dir, batch_id)
+        output_dir = os.path.join(output_dir, batch_id)
 
     # Ensure directories exist
     Path(binary_dir).mkdir(parents=True, exist_ok=True)
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-    # Compile source code
-    compile_file(c_source1, os.path.join(binary_dir, "binary1.bin"))
-    compile_file(c_source2, os.path.join(binary_dir, "binary2.bin"))
-
-    # Copy binaries into the PVC using a temporary Pod
-    create_pod_to_access_output('/app/kubernetes/pvc-access-pod.yaml')
-    wait_for_pod_ready('pvc-access-pod')
-
-    # Copy local binaries into the Pod's PVC
-    for binary in glob.glob(os.path.join(binary_dir, '*.bin')):
-        binary_name = os.path.basename(binary)
-        command = ['kubectl', 'cp', binary, f'pvc-access-pod:/storage/input_binaries/{binary_name}']
+    pairs = discover_source_pairs(os.path.join(source_dir, "version1"), os.path.join(source_dir, "version2"),
+                                  binary_dir, output_dir)
+    if not pairs:
+        logger.info("No source files to analyze.")
+        return None
+
+    for pair in pairs:
+        if not pair.source1:
+            pair.status = "Added in this push; nothing to compare."
+        elif not pair.source2:
+            pair.status = "Removed in this push; nothing to compare."
+
+    # Compile both versions of every source file that has both, in parallel, reusing
+    # cached binaries; added and removed files are never compared
+    compile_jobs = [(source, binary) for pair in pairs if pair.status is None
+                    for source, binary in ((pair.source1, pair.binary1), (pair.source2, pair.binary2))]
+    with span('compile', sources=len(compile_jobs)) as compile_span:
+        compiled, stats = compile_all(compile_jobs)
+        compile_span.set(hits=stats.hits, misses=stats.misses, failed=stats.failed)
+    for pair in pairs:
+        if pair.status is None and (pair.binary1 not in compiled or pair.binary2 not in compiled):
+            pair.status = "Compilation failed."
+    comparable = [pair for pair in pairs if pair.status is None]
+
+    # Pairs with no changed function, or whose changed functions were all compared
+    # before, skip radiff2 and Ghidra. Any other pair is still analyzed in full.
+    fingerprint_store = FingerprintStore()
+    with span('fingerprint', pairs=len(comparable)):
+        for pair in comparable:
+            pair.plan = fingerprint_store.plan(pair.binary1, pair.binary2)
+            if pair.plan is None:
+                continue
+            if not pair.plan.changed:
+                pair.status = "No function changed."
+                continue
+            rows = fingerprint_store.cached_rows(pair.plan)
+            if rows is None:
+                continue
+            if not rows:
+                pair.status = "No function differences."
+                continue
+            # Every changed function was compared before; reuse those radiff2 rows
+            fingerprint_store.write_radiff_output(pair.plan, rows, pair.radiff_output)
+            pair.radiff_cached = True
+    comparable = [pair for pair in comparable if pair.status is None]
+
+    if comparable:
+        binaries = [binary for pair in comparable for binary in (pair.binary1, pair.binary2)]
+        executor = get_executor()
         try:
-            subprocess.check_call(command)
-            logger.info(f"Copied {binary_name} to pvc-access-pod")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error copying {binary_name} to pvc-access-pod: {e}")
-            continue  # Continue processing other binaries
-
-    # Delete the temporary Pod
-    delete_pod('pvc-access-pod')
-
-    # Process each binary file
-    decompiled_files = []
-    for binary in glob.glob(os.path.join(binary_dir, '*.bin')):
-        binary_name = os.path.basename(binary)
-        job_name = f'ghidra-decompiler-job-{binary_name.replace(".", "-")}'
-        job_yaml = f'kubernetes/ghidra-job-{binary_name.replace(".", "-")}.yaml'
-
-        # Create a job manifest for each binary
-        create_ghidra_job_yaml(binary_name, job_name, job_yaml)
-
-        # Submit Kubernetes Job
-        submit_kubernetes_job(job_yaml)
-
-        # Wait for Job to complete
-        if not wait_for_job_completion(job_name):
-            logger.error(f"Job {job_name} failed or timed out.")
-            continue  # Skip to next binary
-
-        # Retrieve decompiled output from Ghidra job logs
-        decompiled_output_file = os.path.join(output_dir, f'{binary_name}.decompiled.txt')
-        if get_job_logs(job_name, decompiled_output_file):
-            decompiled_files.append(decompiled_output_file)
-        else:
-            logger.error(f"Failed to retrieve logs for job {job_name}")
-
-        # Delete the Job
-        delete_job(job_name)
-
-    # Copy decompiled files into the PVC for radiff job
-    create_pod_to_access_output('/app/kubernetes/pvc-access-pod.yaml')
-    wait_for_pod_ready('pvc-access-pod')
-
-    # Copy decompiled files into the Pod's PVC
-    for decompiled_file in decompiled_files:
-        filename = os.path.basename(decompiled_file)
-        command = ['kubectl', 'cp', decompiled_file, f'pvc-access-pod:/storage/output/{filename}']
-        try:
-            subprocess.check_call(command)
-            logger.info(f"Copied {filename} to pvc-access-pod")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error copying {filename} to pvc-access-pod: {e}")
-            continue  # Continue processing other files
-
-    # Delete the temporary Pod
-    delete_pod('pvc-access-pod')
-
-    # Submit Radiff Job
-    submit_kubernetes_job('kubernetes/radiff-job.yaml')
-    if not wait_for_job_completion('radiff-analysis-job'):
-        logger.error("Radiff analysis job failed or timed out.")
-        return
-
-    # Create a Pod to access output data
-    create_pod_to_access_output('kubernetes/output-access.yaml')
-    wait_for_pod_ready('output-access-pod')
-
-    # Copy output files from the Pod
-    if copy_output_from_pod('output-access-pod', '/output/radiff_output.txt', '/shared/output/radiff_output.txt'):
-        logger.info("Copied radiff_output.txt from output-access-pod to /shared/output/")
-    else:
-        logger.error("Failed to copy radiff_output.txt from output-access-pod")
-
-    # Delete the temporary Pod
-    delete_pod('output-access-pod')
-
-    # Delete the Radiff Job
-    delete_job('radiff-analysis-job')
-
-    # Generate the diff report
-    generate_diff_report(
-        radiff_output_file="/shared/output/radiff_output.txt",
-        decompiled_file1="/shared/output/binary1.bin.decompiled.txt",
-        decompiled_file2="/shared/output/binary2.bin.decompiled.txt",
-        report_file="/shared/output/diff_report.txt"
-    )
-
-    logger.info("Diff report generated at /shared/output/diff_report.txt")
-
-def compile_file(source_path, output_binary):
-    try:
-        subprocess.check_call(["gcc", "-g", source_path, "-o", output_binary])
-        logger.info(f"Compiled {source_path} to {output_binary}")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error compiling {source_path}: {e}")
-
-def generate_diff_report(radiff_output_file, decompiled_file1, decompiled_file2, report_file):
+            with span('upload', binaries=len(binaries)) as upload:
+                if not executor.upload_binaries(binaries):
+                    upload.status = 'error'
+                    return None
+
+            # Schedule every decompile of the push at once
+            with span('decompile', binaries=len(binaries)):
+                decompiled = decompile_binaries(executor, binaries, output_dir)
+            for pair in comparable:
+                if pair.binary1 not in decompiled or pair.binary2 not in decompiled:
+                    pair.status = "Decompilation failed."
+            comparable = [pair for pair in comparable if pair.status is None]
+
+            # Compare every pair concurrently
+            radiff_pairs = [(pair.binary1, pair.binary2, pair.radiff_output)
+                            for pair in comparable if not pair.radiff_cached]
+            with span('radiff', pairs=len(radiff_pairs)):
+                radiff_results = executor.radiff_pairs(radiff_pairs)
+            for pair in comparable:
+                if pair.radiff_cached:
+                    continue
+                if not radiff_results.get(pair.radiff_output):
+                    pair.status = "radiff2 comparison failed."
+                elif pair.plan is not None:
+                    fingerprint_store.record(pair.plan, pair.radiff_output)
+        finally:
+            executor.shutdown()
+
+    # Generate one report for the whole push
+    report_file = os.path.join(output_dir, "diff_report.txt")
+    with span('report', sources=len(pairs)):
+        generate_batch_report(pairs, report_file)
+    return report_file
+
+def generate_batch_report(pairs, report_file):
+    # One report per push: a section per source file, each in the single-pair format
+    jsonl_file = jsonl_path_for(report_file)
     try:
-        # Extract function differences from radiff output
-        differences = extract_function_differences(radiff_output_file)
-        
-        # Load decompiled files
-        with open(decompiled_file1, 'r') as f:
-            decompiled_code1 = f.read()
-        with open(decompiled_file2, 'r') as f:
-            decompiled_code2 = f.read()
-        
-        # Generate report
-        with open(report_file, 'w') as f:
-            for diff in differences:
-                name = diff['function_name']
-                similarity = diff['similarity']
-                f.write(f"Function: {name}\n")
-                f.write(f"Similarity: {similarity}\n\n")
-                # Extract code snippets from decompiled code (simplified example)
-                code_snippet1 = extract_function_code(decompiled_code1, name)
-                code_snippet2 = extract_function_code(decompiled_code2, name)
-                f.write("Code in Binary 1:\n")
-                f.write(code_snippet1 + "\n\n")
-                f.write("Code in Binary 2:\n")
-                f.write(code_snippet2 + "\n\n")
-                f.write("=" * 80 + "\n\n")
-        logger.info(f"Diff report generated at {report_file}")
-    except FileNotFoundError as e:
-        logger.error(f"File not found during diff report generation: {e}")
+        with JsonlReportWriter(jsonl_file) as writer:
+            for pair in pairs:
+                status = pair.status
+                if status is None:
+                    missing = [path for path in (pair.radiff_output, pair.decompiled1, pair.decompiled2)
+                               if not os.path.exists(path)]
+                    if missing:
+                        logger.error(f"Analysis output missing for {pair.name}: {missing}")
+                        status = f"Analysis output missing: {', '.join(missing)}"
+                writer.write_source(pair.name, status)
+                if status is None:
+                    writer.write_functions(pair.radiff_output, pair.decompiled1, pair.decompiled2, pair.plan)
+        render_text_report(jsonl_file, report_file)
+        logger.info(f"Diff report generated at {report_file} ({writer.records} records in {jsonl_file})")
     except Exception as e:
         logger.error(f"Error generating diff report: {e}")
 
-def extract_function_code(decompiled_code, function_name):
-    # Remove 'dbg.' or 'sym.' prefixes if present
-    clean_name = function_name.replace('dbg.', '').replace('sym.', '')
-    # Regex pattern to match the function definition and body
-    pattern = rf"^[\w\s\*\(\)]+{re.escape(clean_name)}\s*\([^)]*\)\s*\{{.*?^\}}"
-    matches = re.findall(pattern, decompiled_code, re.MULTILINE | re.DOTALL)
-    if matches:
-        return matches[0]
-    else:
-        return f"Function '{clean_name}' code not found in decompiled output."
-
-def submit_kubernetes_job(job_manifest_path):
-    try:
-        config.load_kube_config()
-        batch_v1 = client.BatchV1Api()
-        with open(job_manifest_path) as f:
-            job_manifest = yaml.safe_load(f)
-        job_name = job_manifest['metadata']['name']
-        batch_v1.create_namespaced_job(
-            body=job_manifest,
-            namespace='default')
-        logger.info(f"Job {job_name} submitted.")
-    except ApiException as e:
-        if e.status == 409:
-            logger.warning(f"Job {job_name} already exists.")
-        else:
-            logger.error(f"Error submitting job {job_name}: {e}")
-            sys.exit(1)
-
-def wait_for_job_completion(job_name, timeout=600):
-    try:
-        config.load_kube_config()
-        batch_v1 = client.BatchV1Api()
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            job = batch_v1.read_namespaced_job(name=job_name, namespace='default')
-            if job.status.succeeded and job.status.succeeded >= 1:
-                logger.info(f"Job {job_name} completed successfully.")
-                return True
-            elif job.status.failed and job.status.failed >= 1:
-                logger.error(f"Job {job_name} failed.")
-                return False
-            else:
-                logger.info(f"Job {job_name} is still running...")
-                time.sleep(5)
-        logger.error(f"Timeout waiting for job {job_name} to complete.")
-        return False
-    except ApiException as e:
-        logger.error(f"Error checking job status for {job_name}: {e}")
-        return False
-
-def create_pod_to_access_output(pod_manifest_path):
-    try:
-        config.load_kube_config()
-        core_v1 = client.CoreV1Api()
-        with open(pod_manifest_path) as f:
-            pod_manifest = yaml.safe_load(f)
-        pod_name = pod_manifest['metadata']['name']
-        core_v1.create_namespaced_pod(
-            body=pod_manifest,
-            namespace='default')
-        logger.info(f"Pod {pod_name} created.")
-    except ApiException as e:
-        if e.status == 409:
-            logger.warning(f"Pod {pod_name} already exists.")
-        else:
-            logger.error(f"Error creating pod {pod_name}: {e}")
-            sys.exit(1)
-
-def wait_for_pod_ready(pod_name, timeout=300):
-    try:
-        config.load_kube_config()
-        core_v1 = client.CoreV1Api()
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            pod = core_v1.read_namespaced_pod(name=pod_name, namespace='default')
-            if pod.status.phase == 'Running':
-                logger.info(f"Pod {pod_name} is running.")
-                return True
-            elif pod.status.phase in ['Failed', 'Unknown']:
-                logger.error(f"Pod {pod_name} failed with status: {pod.status.phase}")
-                return False
-            else:
-                logger.info(f"Pod {pod_name} status: {pod.status.phase}")
-                time.sleep(5)
-        logger.error(f"Timeout waiting for pod {pod_name} to be ready.")
-        return False
-    except ApiException as e:
-        logger.error(f"Error checking pod status for {pod_name}: {e}")
-        return False
-
-def copy_output_from_pod(pod_name, remote_path, local_path):
-    command = ['kubectl', 'cp', f'{pod_name}:{remote_path}', local_path]
-    try:
-        subprocess.check_call(command)
-        logger.info(f"Copied {remote_path} from pod {pod_name} to {local_path}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error copying files from pod {pod_name}: {e}")
-        return False
+def jsonl_path_for(report_file):
+    return f"{os.path.splitext(report_file)[0]}.jsonl"
 
-def delete_pod(pod_name):
-    try:
-        config.load_kube_config()
-        core_v1 = client.CoreV1Api()
-        core_v1.delete_namespaced_pod(name=pod_name, namespace='default', body=client.V1DeleteOptions())
-        logger.info(f"Pod {pod_name} deleted.")
-    except ApiException as e:
-        logger.error(f"Error deleting pod {pod_name}: {e}")
+@functools.lru_cache(maxsize=4)
+def index_decompiled_text(decompiled_code):
+    # Encoded text and its function spans, built once per text however many lookups follow
+    encoded = decompiled_code.encode()
+    builder = FunctionIndexBuilder()
+    for line in encoded.splitlines(keepends=True):
+        builder.feed(line)
+    return encoded, builder.finish()
 
-def delete_job(job_name):
-    try:
-        config.load_kube_config()
-        batch_v1 = client.BatchV1Api()
-        batch_v1.delete_namespaced_job(
-            name=job_name,
-            namespace='default',
-            body=client.V1DeleteOptions(propagation_policy='Foreground'))
-        logger.info(f"Job {job_name} deleted.")
-    except ApiException as e:
-        logger.error(f"Error deleting job {job_name}: {e}")
-
-def get_job_logs(job_name, output_file):
-    config.load_kube_config()
-    core_v1 = client.CoreV1Api()
-    label_selector = f'job-name={job_name}'
-    pods = core_v1.list_namespaced_pod(namespace='default', label_selector=label_selector)
-    if not pods.items:
-        print(f"No pods found for job {job_name}")
-        sys.exit(1)
-    pod_name = pods.items[0].metadata.name
-    logs = core_v1.read_namespaced_pod_log(name=pod_name, namespace='default')
-    with open(output_file, 'w') as f:
-        f.write(logs)
-    print(f"Saved decompiled output from job {job_name} to {output_file}")
-
-def create_ghidra_job_yaml(binary_name, job_name, job_yaml_path):
-    ghidra_job_manifest = {
-        "apiVersion": "batch/v1",
-        "kind": "Job",
-        "metadata": {
-            "name": job_name
-        },
-        "spec": {
-            "template": {
-                "metadata": {
-                    "labels": {
-                        "app": "ghidra-decompiler"
-                    }
-                },
-                "spec": {
-                    "containers": [
-                        {
-                            "name": "ghidra-decompiler",
-                            "image": "cincan/ghidra-decompiler:latest",
-                            "args": [
-                                "decompile",
-                                f"/app/input_binaries/{binary_name}"
-                            ],
-                            "volumeMounts": [
-                                {
-                                    "name": "input-output-storage",
-                                    "mountPath": "/app/input_binaries",
-                                    "subPath": "input_binaries"
-                                }
-                            ]
-                        }
-                    ],
-                    "restartPolicy": "Never",
-                    "volumes": [
-                        {
-                            "name": "input-output-storage",
-                            "persistentVolumeClaim": {
-                                "claimName": "input-output-pvc"
-                            }
-                        }
-                    ]
-                }
-            }
-        }
-    }
-    with open(job_yaml_path, 'w') as f:
-        yaml.dump(ghidra_job_manifest, f)
+def extract_function_code(decompiled_code, function_name):
+    # Lookup in an in-memory string; files on disk should use FunctionIndex instead
+    encoded, functions = index_decompiled_text(decompiled_code)
+    body_span = functions.get(clean_function_name(function_name))
+    if body_span is None:
+        return function_not_found(function_name)
+    return encoded[body_span[0]:body_span[1]].decode('utf-8', 'replace')
 
 if __name__ == "__main__":
     shared_dir = '/shared'
-    source_dir = Path("/shared/c_source/version1")
     binary_dir = os.path.join(shared_dir, "input_binaries")
     output_dir = os.path.join(shared_dir, "output")
 
@@ -387,24 +230,24 @@ if __name__ == "__main__":
     os.makedirs(binary_dir, exist_ok=True)
     os.makedirs(output_dir, exist_ok=True)
 
-    logger.info("Monitoring for incoming files...")
+    # Pushes arrive as complete batch directories published by the webhook receiver
+    intake = BatchIntake()
+    intake.start()
+    logger.info(f"Waiting for batches in {intake.ready_dir}...")
     while True:
-        if source_dir.exists() and any(source_dir.glob("*.c")):
-            logger.info("Detected new source files, starting compilation and analysis...")
-            compile_and_analyze()
-            # Remove processed C files to prevent reprocessing
-            for file in source_dir.glob("*.c"):
-                try:
-                    file.unlink()
-                    logger.info(f"Deleted processed file: {file}")
-                except Exception as e:
-                    logger.error(f"Error deleting file {file}: {e}")
-            version2_dir = Path("/shared/c_source/version2")
-            for file in version2_dir.glob("*.c"):
-                try:
-                    file.unlink()
-                    logger.info(f"Deleted processed file: {file}")
-                except Exception as e:
-                    logger.error(f"Error deleting file {file}: {e}")
-            logger.info("Processing completed, continuing to monitor for new files...")
-        time.sleep(5)
+        batch_id, batch_dir = intake.get()
+        logger.info(f"Starting compilation and analysis of batch {batch_id}...")
+        report_file = None
+        try:
+            # Writes /shared/traces/<batch_id>.trace.json and refreshes the metrics file
+            with tracing.run(batch_id):
+                report_file = compile_and_analyze(source_dir=batch_dir, binary_dir=binary_dir, output_dir=output_dir,
+                                    batch_id=batch_id)
+        except Exception as e:
+            logger.error(f"Error analyzing batch {batch_id}: {e}")
+        finally:
+            # The compile cache keeps its own copies of the binaries
+            shutil.rmtree(os.path.join(binary_dir, batch_id), ignore_errors=True)
+            # Record the report location and remove processed sources to prevent reprocessing
+            intake.done(batch_id, report_file)
+        logger.info(f"Batch {batch_id} completed (report: {report_file}), {intake.queue.qsize()} waiting")
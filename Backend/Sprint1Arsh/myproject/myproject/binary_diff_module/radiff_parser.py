@@ -0,0 +1,161 @@
+import re
+from array import array
+
+# One row of `radiff2 -A -C` output:
+#   <name1> <size1> <addr1> | <STATUS> (<similarity>) | <addr2> <size2> <name2>
+# NEW rows only have the left-hand side; RadiffTable keeps them, the diff report does not.
+RADIFF_LINE = re.compile(
+    r'^\s*(\S+)\s+(\d+)\s+(\S+)\s+\|\s+(\S+)\s+\(([\d.]+)\)(?:\s+\|\s+(\S+)\s+(\d+)\s+(\S+))?\s*$'
+)
+
+# Status names are stored as small integer codes in RadiffTable; unknown ones are appended
+STATUS_NAMES = ['MATCH', 'UNMATCH', 'NEW', 'COMPLETE']
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_NAMES)}
+NO_ADDRESS = 0xFFFFFFFFFFFFFFFF
+IDENTICAL = '(1.000000)'
+
+
+class RadiffRecord:
+    __slots__ = ('function_name', 'size1', 'address1', 'status', 'similarity',
+                 'address2', 'size2', 'function_name2')
+
+    def __init__(self, function_name, size1, address1, status, similarity, address2, size2, function_name2):
+        self.function_name = function_name
+        self.size1 = size1
+        self.address1 = address1
+        self.status = status
+        self.similarity = similarity
+        self.address2 = address2
+        self.size2 = size2
+        self.function_name2 = function_name2
+
+    def as_dict(self):
+        # Shape used by the diff report since the first version of this module
+        return {
+            'function_name': self.function_name,
+            'similarity': self.similarity,
+            'address1': self.address1,
+            'size1': self.size1,
+            'address2': self.address2,
+            'size2': self.size2,
+        }
+
+
+def parse_line(line):
+    match = RADIFF_LINE.match(line)
+    if not match:
+        return None
+    name1, size1, addr1, status, similarity, addr2, size2, name2 = match.groups()
+    return RadiffRecord(name1, int(size1), addr1, status, float(similarity),
+                        addr2, int(size2) if size2 is not None else None, name2)
+
+
+def iter_radiff_records(radiff_output_file):
+    # Every parsed row, MATCH included, one at a time
+    with open(radiff_output_file, 'r') as f:
+        for line in f:
+            record = parse_line(line)
+            if record is not None:
+                yield record
+
+
+def iter_function_differences(radiff_output_file, threshold=1.0):
+    # Rows whose similarity is below the threshold, i.e. functions that changed.
+    # Identical functions are the bulk of a typical diff, so rows with similarity
+    # 1.0 are dropped with a substring test before the regex runs. One-sided NEW
+    # rows have no counterpart to diff against and are left out, as they always were.
+    skip_identical = threshold <= 1.0
+    with open(radiff_output_file, 'r') as f:
+        for line in f:
+            if skip_identical and IDENTICAL in line:
+                continue
+            record = parse_line(line)
+            if record is not None and record.address2 is not None and record.similarity < threshold:
+                yield record
+
+
+def status_code(status):
+    code = STATUS_CODES.get(status)
+    if code is None:
+        code = STATUS_CODES[status] = len(STATUS_NAMES)
+        STATUS_NAMES.append(status)
+    return code
+
+
+def _address(value):
+    if value is None:
+        return NO_ADDRESS
+    try:
+        return int(value, 16)
+    except ValueError:
+        return NO_ADDRESS
+
+
+class RadiffTable:
+    # Column-oriented view of a whole radiff output. Numeric columns live in typed
+    # arrays and names in plain lists, so a million-row diff costs a few dozen bytes
+    # per row and can be filtered and sorted by index without building row objects.
+
+    def __init__(self):
+        self.names1 = []
+        self.names2 = []
+        self.size1 = array('q')
+        self.size2 = array('q')
+        self.address1 = array('Q')
+        self.address2 = array('Q')
+        self.status = array('B')
+        self.similarity = array('d')
+
+    @classmethod
+    def from_file(cls, radiff_output_file):
+        table = cls()
+        match_line = RADIFF_LINE.match
+        with open(radiff_output_file, 'r') as f:
+            for line in f:
+                match = match_line(line)
+                if match:
+                    table._append(match.groups())
+        return table
+
+    def _append(self, groups):
+        name1, size1, addr1, status, similarity, addr2, size2, name2 = groups
+        self.names1.append(name1)
+        # Most rows pair a function with itself; share the string instead of storing it twice
+        self.names2.append(name1 if name2 == name1 else name2)
+        self.size1.append(int(size1))
+        self.size2.append(int(size2) if size2 is not None else -1)
+        self.address1.append(_address(addr1))
+        self.address2.append(_address(addr2))
+        self.status.append(status_code(status))
+        self.similarity.append(float(similarity))
+
+    def __len__(self):
+        return len(self.similarity)
+
+    def where(self, max_similarity=None, statuses=None):
+        # Indices of rows with similarity strictly below max_similarity and/or one of the given statuses
+        codes = {STATUS_CODES[status] for status in statuses if status in STATUS_CODES} if statuses else None
+        similarity = self.similarity
+        status = self.status
+        return array('q', (
+            i for i in range(len(similarity))
+            if (max_similarity is None or similarity[i] < max_similarity)
+            and (codes is None or status[i] in codes)
+        ))
+
+    def sorted_by(self, column, indices=None, reverse=False):
+        values = getattr(self, column)
+        if indices is None:
+            indices = range(len(self))
+        return array('q', sorted(indices, key=values.__getitem__, reverse=reverse))
+
+    def row(self, i):
+        address2 = self.address2[i]
+        return RadiffRecord(
+            self.names1[i], self.size1[i], hex(self.address1[i]), STATUS_NAMES[self.status[i]],
+            self.similarity[i], hex(address2) if address2 != NO_ADDRESS else None,
+            self.size2[i] if self.size2[i] >= 0 else None, self.names2[i])
+
+    def records(self, indices=None):
+        for i in (range(len(self)) if indices is None else indices):
+            yield self.row(i)
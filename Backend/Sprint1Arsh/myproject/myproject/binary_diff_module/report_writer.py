@@ -0,0 +1,124 @@
+import difflib
+import json
+import logging
+import mmap
+from contextlib import contextmanager
+
+from function_index import FunctionIndex, clean_function_name
+from radiff_parser import iter_function_differences
+
+logger = logging.getLogger(__name__)
+
+# diff_report.jsonl holds one JSON object per line:
+#   {"type": "source", "source": ..., "status": ...}      starts the section of one source file
+#   {"type": "function", "function": ..., "similarity": ..., "size1": ..., "address1": ...,
+#    "size2": ..., "address2": ..., "code1": ..., "code2": ..., "diff": ...}
+# Every line is flushed as soon as it is written, so consumers can tail the file
+# while the rest of the report is still being produced.
+
+
+@contextmanager
+def open_mapped(path):
+    # Read-only memory map of a decompiled file; bodies are sliced out of the page cache
+    # instead of loading the file. Empty files cannot be mapped and are read normally.
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield f
+            return
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def function_not_found(function_name):
+    return f"Function '{clean_function_name(function_name)}' code not found in decompiled output."
+
+
+def unified_diff(function_name, code1, code2):
+    return '\n'.join(difflib.unified_diff(
+        (code1 or '').splitlines(), (code2 or '').splitlines(),
+        fromfile=f"binary1/{function_name}", tofile=f"binary2/{function_name}", lineterm=''))
+
+
+def iter_function_records(radiff_output_file, decompiled_file1, decompiled_file2, plan=None):
+    # One record per changed function, reading each body by offset from the function index
+    index1 = FunctionIndex.load_or_build(decompiled_file1)
+    index2 = FunctionIndex.load_or_build(decompiled_file2)
+    with open_mapped(decompiled_file1) as decompiled1, open_mapped(decompiled_file2) as decompiled2:
+        for record in iter_function_differences(radiff_output_file):
+            # With a fingerprint plan, functions whose fingerprints are identical are MATCH
+            # regardless of what radiff2 reported for them
+            if plan is not None and plan.is_local_match(record.function_name):
+                continue
+            code1 = index1.read(record.function_name, decompiled1)
+            code2 = index2.read(record.function_name, decompiled2)
+            yield {
+                'type': 'function',
+                'function': record.function_name,
+                'function2': record.function_name2,
+                'status': record.status,
+                'similarity': record.similarity,
+                'size1': record.size1,
+                'address1': record.address1,
+                'size2': record.size2,
+                'address2': record.address2,
+                'code1': code1,
+                'code2': code2,
+                'diff': unified_diff(clean_function_name(record.function_name), code1, code2),
+            }
+
+
+class JsonlReportWriter:
+    def __init__(self, jsonl_file):
+        self.jsonl_file = jsonl_file
+        self.records = 0
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.jsonl_file, 'w')
+        return self
+
+    def __exit__(self, *exc_info):
+        self._f.close()
+
+    def write(self, record):
+        self._f.write(json.dumps(record) + "\n")
+        self._f.flush()
+        self.records += 1
+
+    def write_source(self, source, status=None):
+        self.write({'type': 'source', 'source': source, 'status': status})
+
+    def write_functions(self, radiff_output_file, decompiled_file1, decompiled_file2, plan=None):
+        for record in iter_function_records(radiff_output_file, decompiled_file1, decompiled_file2, plan):
+            self.write(record)
+
+
+def iter_report(jsonl_file):
+    with open(jsonl_file) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def render_text_report(jsonl_file, report_file):
+    # The human-readable diff_report.txt, rendered one record at a time
+    with open(report_file, 'w') as f:
+        for record in iter_report(jsonl_file):
+            if record['type'] == 'source':
+                f.write(f"Source: {record['source']}\n")
+                f.write("#" * 80 + "\n\n")
+                if record.get('status'):
+                    f.write(f"{record['status']}\n\n")
+                continue
+            name = record['function']
+            f.write(f"Function: {name}\n")
+            f.write(f"Similarity: {record['similarity']}\n\n")
+            f.write("Code in Binary 1:\n")
+            f.write((record['code1'] or function_not_found(name)) + "\n\n")
+            f.write("Code in Binary 2:\n")
+            f.write((record['code2'] or function_not_found(name)) + "\n\n")
+            f.write("=" * 80 + "\n\n")
@@ -0,0 +1,232 @@
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# One <run id>.trace.json per run, in Chrome trace event format (chrome://tracing, Perfetto)
+TRACE_DIR = os.getenv("TRACE_DIR", "/shared/traces")
+# Prometheus text exposition file, rewritten after every run (node_exporter textfile collector)
+METRICS_FILE = os.getenv("METRICS_FILE", "/shared/metrics/binary_diff.prom")
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'status', 'thread')
+
+    def __init__(self, name, span_id, parent_id, start, attributes):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+        self.status = 'ok'
+        self.thread = threading.current_thread().name
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Tracer:
+    # Collects the spans of one run. Spans nest per thread; a span opened in a thread
+    # with no open span becomes a child of the run's root span.
+
+    def __init__(self, run_id, record=True):
+        self.run_id = run_id
+        self.record = record
+        self.spans = []
+        self.root_id = None
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, **attributes):
+        stack = self._stack()
+        parent_id = stack[-1].span_id if stack else self.root_id
+        current = Span(name, next(self._ids), parent_id, time.time(), attributes)
+        if self.root_id is None:
+            self.root_id = current.span_id
+        stack.append(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.status = 'error'
+            current.attributes.setdefault('error', f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            current.end = time.time()
+            stack.pop()
+            self._add(current)
+
+    def add_span(self, name, start, end, status='ok', **attributes):
+        # Records a span measured elsewhere, e.g. from Kubernetes object timestamps
+        stack = self._stack()
+        current = Span(name, next(self._ids), stack[-1].span_id if stack else self.root_id, start, attributes)
+        current.end = end
+        current.status = status
+        self._add(current)
+        return current
+
+    def _add(self, current):
+        if self.record:
+            with self._lock:
+                self.spans.append(current)
+
+    def to_trace_events(self):
+        threads = {}
+        events = []
+        for current in sorted(self.spans, key=lambda s: s.start):
+            tid = threads.setdefault(current.thread, len(threads) + 1)
+            events.append({
+                'name': current.name,
+                'ph': 'X',
+                'ts': int(current.start * 1e6),
+                'dur': int(current.duration * 1e6),
+                'pid': 1,
+                'tid': tid,
+                'args': dict(current.attributes, span_id=current.span_id, parent_id=current.parent_id,
+                             status=current.status),
+            })
+        events.extend({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}}
+                      for name, tid in threads.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'run_id': self.run_id}}
+
+    def export(self, trace_dir=TRACE_DIR):
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"{self.run_id}.trace.json")
+        _write_atomic(path, json.dumps(self.to_trace_events()))
+        return path
+
+    def summary(self):
+        # Total seconds per span name, for the end-of-run log line
+        totals = {}
+        for current in self.spans:
+            totals[current.name] = totals.get(current.name, 0.0) + current.duration
+        return totals
+
+
+class Histogram:
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    # Process-wide metrics, accumulated over every run since the service started
+
+    def __init__(self):
+        self.durations = {}  # span name -> Histogram
+        self.errors = {}     # span name -> count
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def observe_run(self, tracer):
+        with self._lock:
+            self.runs += 1
+            for current in tracer.spans:
+                self.durations.setdefault(current.name, Histogram()).observe(current.duration)
+                if current.status != 'ok':
+                    self.errors[current.name] = self.errors.get(current.name, 0) + 1
+
+    def render(self):
+        lines = [
+            "# HELP binary_diff_runs_total Pipeline runs completed.",
+            "# TYPE binary_diff_runs_total counter",
+            f"binary_diff_runs_total {self.runs}",
+            "# HELP binary_diff_span_duration_seconds Duration of pipeline stages and Kubernetes calls.",
+            "# TYPE binary_diff_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self.durations.items()):
+                label = f'span="{_escape(name)}"'
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'binary_diff_span_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'binary_diff_span_duration_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f'binary_diff_span_duration_seconds_sum{{{label}}} {histogram.sum:.6f}')
+                lines.append(f'binary_diff_span_duration_seconds_count{{{label}}} {histogram.count}')
+            lines.append("# HELP binary_diff_span_errors_total Spans that ended with an exception or failure.")
+            lines.append("# TYPE binary_diff_span_errors_total counter")
+            for name, count in sorted(self.errors.items()):
+                lines.append(f'binary_diff_span_errors_total{{span="{_escape(name)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, self.render())
+
+
+def _escape(value):
+    return re.sub(r'(["\\])', r'\\\1', value).replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    # Scrapers and trace viewers must never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+# Spans outside a run (ad-hoc calls, scripts) go to a tracer that keeps nothing
+_idle_tracer = Tracer('idle', record=False)
+_current = None
+
+
+def current_tracer():
+    return _current or _idle_tracer
+
+
+def span(name, **attributes):
+    return current_tracer().span(name, **attributes)
+
+
+def add_span(name, start, end, status='ok', **attributes):
+    return current_tracer().add_span(name, start, end, status, **attributes)
+
+
+@contextmanager
+def run(run_id, trace_dir=TRACE_DIR, metrics_file=METRICS_FILE):
+    # Traces everything inside the block as one run, then writes its trace file and
+    # refreshes the metrics file
+    global _current
+    tracer = Tracer(run_id)
+    _current = tracer
+    try:
+        with tracer.span('run', run_id=run_id):
+            yield tracer
+    finally:
+        _current = None
+        try:
+            metrics.observe_run(tracer)
+            trace_file = tracer.export(trace_dir)
+            metrics.write(metrics_file)
+            stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in tracer.summary().items())
+            logger.info(f"Trace for {run_id} written to {trace_file}: {stages}")
+        except OSError as e:
+            logger.error(f"Error writing trace or metrics for {run_id}: {e}")
@@ -0,0 +1,139 @@
+import http.client
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from decompile_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+TOKEN_HEADER = 'X-Transfer-Token'
+
+
+class TransferError(Exception):
+    pass
+
+
+def _tar_chunks(files):
+    # Streams a tar of (local path, remote path) pairs without building it in memory:
+    # a producer thread writes the archive into a pipe and we yield what comes out.
+    read_fd, write_fd = os.pipe()
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                with tarfile.open(fileobj=pipe, mode='w|') as tar:
+                    for local_path, remote_path in files:
+                        tar.add(local_path, arcname=remote_path)
+        except BrokenPipeError:
+            # The consumer went away (e.g. the connection dropped)
+            pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    with os.fdopen(read_fd, 'rb') as pipe:
+        for chunk in iter(lambda: pipe.read(CHUNK_SIZE), b''):
+            yield chunk
+    producer.join()
+
+
+class TransferClient:
+    # Talks to transfer_server.py over a single keep-alive connection. Uploads and
+    # downloads are batched into one streamed tar per call.
+
+    def __init__(self, base_url, token, timeout=300):
+        parsed = urlparse(base_url)
+        self.base_url = base_url
+        self.token = token
+        self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+
+    def close(self):
+        self.connection.close()
+
+    def _request(self, method, path, body=None, headers=None):
+        try:
+            self.connection.request(method, path, body=body, headers=dict(headers or {}, **{TOKEN_HEADER: self.token}))
+            return self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+
+    def _json(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            response = self._request(method, path, body, headers)
+        except (http.client.HTTPException, OSError):
+            # A kept-alive connection may have been closed by the server; retry once on a fresh one
+            response = self._request(method, path, body, headers)
+        data = response.read()
+        if response.status != 200:
+            raise TransferError(f"{method} {path} failed with {response.status}: {data[:200]!r}")
+        return json.loads(data)
+
+    def wait_until_ready(self, timeout=120):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self._json('GET', '/healthz')
+                return True
+            except (TransferError, http.client.HTTPException, OSError) as e:
+                if time.time() >= deadline:
+                    logger.error(f"Transfer endpoint {self.base_url} not reachable: {e}")
+                    return False
+                time.sleep(0.5)
+
+    def upload(self, files):
+        # files: list of (local path, path relative to the volume root). Files that are
+        # already present on the volume with the same SHA-256 are skipped.
+        remote_hashes = self._json('POST', '/manifest', {'paths': [remote for _, remote in files]})
+        pending = [(local, remote) for local, remote in files if remote_hashes.get(remote) != file_sha256(local)]
+        skipped = len(files) - len(pending)
+        if not pending:
+            logger.info(f"All {skipped} file(s) already present on the volume, nothing to upload")
+            return []
+
+        response = self._request('PUT', '/upload', _tar_chunks(pending), {'Content-Type': 'application/x-tar'})
+        data = response.read()
+        if response.status != 200:
+            raise TransferError(f"Upload failed with {response.status}: {data[:200]!r}")
+        written = json.loads(data)['written']
+        logger.info(f"Uploaded {len(written)} file(s), skipped {skipped} unchanged")
+        return written
+
+    def download(self, files):
+        # files: list of (path relative to the volume root, local path)
+        targets = dict(files)
+        response = self._request('POST', '/download', json.dumps({'paths': list(targets)}).encode(),
+                                 {'Content-Type': 'application/json'})
+        if response.status != 200:
+            raise TransferError(f"Download failed with {response.status}: {response.read()[:200]!r}")
+
+        received = []
+        with tarfile.open(fileobj=response, mode='r|') as tar:
+            for member in tar:
+                local_path = targets.get(member.name)
+                if local_path is None or not member.isfile():
+                    continue
+                os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path) or '.', suffix='.part')
+                try:
+                    with os.fdopen(fd, 'wb') as out:
+                        source = tar.extractfile(member)
+                        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                            out.write(chunk)
+                    os.replace(tmp_path, local_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                received.append(local_path)
+        # Consume the end-of-archive padding so the connection can be reused
+        response.read()
+        logger.info(f"Downloaded {len(received)} file(s)")
+        return received
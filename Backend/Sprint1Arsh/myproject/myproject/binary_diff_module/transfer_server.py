@@ -0,0 +1,227 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+# Root of the mounted input-output-pvc volume
+STORAGE_ROOT = os.path.realpath(os.getenv("STORAGE_ROOT", "/storage"))
+PORT = int(os.getenv("TRANSFER_PORT", "8080"))
+# Interface to listen on. In the cluster the pod is only reachable through its
+# ClusterIP Service; outside it, bind to 127.0.0.1 or publish the port on localhost only.
+BIND_ADDRESS = os.getenv("TRANSFER_BIND", "0.0.0.0")
+# Shared secret every request except /healthz must carry in the X-Transfer-Token header
+TRANSFER_TOKEN = os.getenv("TRANSFER_TOKEN")
+TOKEN_HEADER = 'X-Transfer-Token'
+CHUNK_SIZE = 1024 * 1024
+
+# path -> (size, mtime_ns, sha256), so unchanged files are not re-hashed on every manifest request
+_hash_cache = {}
+_hash_lock = threading.Lock()
+
+
+def resolve(relative_path):
+    # Map a client supplied path onto the volume, refusing anything that escapes it
+    path = os.path.realpath(os.path.join(STORAGE_ROOT, relative_path.lstrip('/')))
+    if path != STORAGE_ROOT and not path.startswith(STORAGE_ROOT + os.sep):
+        raise ValueError(f"Path outside storage root: {relative_path}")
+    return path
+
+
+def file_hash(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    with _hash_lock:
+        cached = _hash_cache.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    with _hash_lock:
+        _hash_cache[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+
+class ChunkedWriter:
+    # Minimal file object that frames everything written to it as HTTP/1.1 chunks
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + bytes(data) + b"\r\n")
+        return len(data)
+
+    def close(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ChunkedReader:
+    # Reads a chunked request body as a plain stream
+    def __init__(self, rfile):
+        self.rfile = rfile
+        self.remaining = 0
+        self.done = False
+
+    def read(self, size=-1):
+        if self.done:
+            return b''
+        if self.remaining == 0:
+            line = self.rfile.readline().strip()
+            self.remaining = int(line.split(b';')[0], 16)
+            if self.remaining == 0:
+                # Consume optional trailers up to the blank line
+                while self.rfile.readline().strip():
+                    pass
+                self.done = True
+                return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        if self.remaining == 0:
+            self.rfile.readline()
+        return data
+
+
+class LimitedReader:
+    # Reads a Content-Length delimited request body without running past it
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+
+class TransferHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _body_stream(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            return ChunkedReader(self.rfile)
+        length = int(self.headers.get('Content-Length', 0))
+        return LimitedReader(self.rfile, length)
+
+    def _read_json(self):
+        return json.loads(self._body_stream().read() or b'{}')
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            # Tells the client to open a new connection for its next request
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.headers.get(TOKEN_HEADER, '')
+        if hmac.compare_digest(token.encode(), TRANSFER_TOKEN.encode()):
+            return True
+        logger.warning(f"Refused {self.command} {self.path} from {self.client_address[0]}: bad or missing token")
+        # The request body is left unread, so this connection cannot be reused
+        self.close_connection = True
+        self._send_json(401, {'error': 'unauthorized'})
+        return False
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            if self.path == '/manifest':
+                paths = self._read_json().get('paths', [])
+                self._send_json(200, {path: file_hash(resolve(path)) for path in paths})
+            elif self.path == '/download':
+                self._download(self._read_json().get('paths', []))
+            else:
+                self._send_json(404, {'error': 'not found'})
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+
+    def do_PUT(self):
+        if not self._authorized():
+            return
+        if self.path != '/upload':
+            self._send_json(404, {'error': 'not found'})
+            return
+        written = []
+        body = self._body_stream()
+        try:
+            with tarfile.open(fileobj=body, mode='r|') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    target = resolve(member.name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    # Write next to the target and rename, so readers never see partial files
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+                    try:
+                        with os.fdopen(fd, 'wb') as out:
+                            source = tar.extractfile(member)
+                            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                                out.write(chunk)
+                        os.replace(tmp_path, target)
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.unlink(tmp_path)
+                    written.append(member.name)
+        except (ValueError, tarfile.TarError) as e:
+            logger.error(f"Upload rejected: {e}")
+            # The rest of the body is unread, so this connection cannot be reused
+            self.close_connection = True
+            self._send_json(400, {'error': str(e), 'written': written})
+            return
+        # Drain the tar end-of-archive padding so the connection can serve the next request
+        while body.read(CHUNK_SIZE):
+            pass
+        logger.info(f"Stored {len(written)} uploaded file(s)")
+        self._send_json(200, {'written': written})
+
+    def _download(self, paths):
+        resolved = [(path, resolve(path)) for path in paths]
+        missing = [path for path, full_path in resolved if not os.path.isfile(full_path)]
+        if missing:
+            self._send_json(404, {'error': 'missing files', 'missing': missing})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-tar')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        writer = ChunkedWriter(self.wfile)
+        with tarfile.open(fileobj=writer, mode='w|', bufsize=CHUNK_SIZE) as tar:
+            for path, full_path in resolved:
+                tar.add(full_path, arcname=path)
+        writer.close()
+        logger.info(f"Sent {len(resolved)} file(s)")
+
+
+if __name__ == "__main__":
+    if not TRANSFER_TOKEN:
+        raise SystemExit("TRANSFER_TOKEN is not set")
+    server = ThreadingHTTPServer((BIND_ADDRESS, PORT), TransferHandler)
+    logger.info(f"Serving {STORAGE_ROOT} on {BIND_ADDRESS}:{PORT}")
+    server.serve_forever()
@@ -1,10 +1,16 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
-import requests
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import httpx
+import json
+import logging
 import os
 import secrets
 
+from github_client import GitHubClient, GitHubError, response_body
+
 app = FastAPI()
+logger = logging.getLogger("uvicorn.error")
 
 # No need to check IP here since Nginx will handle it
 
@@ -14,49 +20,56 @@ AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
 if not AUTH_TOKEN:
     raise RuntimeError("AUTH_TOKEN is not set in environment variables")
 
-@app.post("/create-webhook")
-async def create_webhook(request: Request):
-    data = await request.json()
+SECRET_FILE = os.getenv("WEBHOOK_SECRET_FILE", "/shared/secret.txt")
+
+# One pooled client for all GitHub calls, created with the event loop
+github = None
+
+
+@app.on_event("startup")
+async def open_github_client():
+    global github
+    github = GitHubClient()
+
+
+@app.on_event("shutdown")
+async def close_github_client():
+    await github.close()
+
 
+def check_auth(request):
     token = request.headers.get("Authorization")
 
     if token != f"Bearer {AUTH_TOKEN}":
         raise HTTPException(status_code=403, detail="Forbidden: Invalid token")
 
-    repo_url = data.get('repo_url')
-    access_token = data.get('access_token')
-
-    if not repo_url or not access_token:
-        raise HTTPException(status_code=400, detail="Missing parameters")
 
-    # Extract owner and repo from repo_url
-    try:
-        owner_repo = repo_url.rstrip('/').split('github.com/')[1]
-        owner, repo = owner_repo.split('/')
-    except (IndexError, ValueError):
-        raise HTTPException(status_code=400, detail="Invalid repository URL")
-
-    # Generate a secret for the webhook
-    webhook_secret = secrets.token_hex(20)
+def parse_repo(repo):
+    # "https://github.com/<owner>/<repo>" or "<owner>/<repo>" -> (owner, repo)
+    owner_repo = repo.rstrip('/')
+    if owner_repo.endswith('.git'):
+        owner_repo = owner_repo[:-len('.git')]
+    if 'github.com/' in owner_repo:
+        owner_repo = owner_repo.split('github.com/')[1]
+    owner, name = owner_repo.split('/')
+    if not owner or not name:
+        raise ValueError(repo)
+    return owner, name
 
-    # Store the secret in a shared volume
-    with open('/shared/secret.txt', 'w') as f:
-        f.write(webhook_secret)
 
+def webhook_url():
     # Get the webhook URL from environment variable
-    webhook_url = os.environ.get('WEBHOOK_URL')
-    if not webhook_url:
+    url = os.environ.get('WEBHOOK_URL')
+    if not url:
         raise HTTPException(status_code=500, detail="Webhook URL not configured")
+    return url
 
-    # Prepare the payload for GitHub API
-    headers = {
-        'Authorization': f'token {access_token}',
-        'Accept': 'application/vnd.github+json'
-    }
-    payload = {
+
+def hook_payload(url, webhook_secret):
+    return {
         'name': 'web',
         'config': {
-            'url': f'{webhook_url}',
+            'url': f'{url}',
             'content_type': 'json',
             'secret': webhook_secret,
             'insecure_ssl': '0'
@@ -65,14 +78,189 @@ async def create_webhook(request: Request):
         'active': True
     }
 
+
+def store_secret(webhook_secret):
+    # Store the secret in a shared volume
+    with open(SECRET_FILE, 'w') as f:
+        f.write(webhook_secret)
+
+
+def shared_secret():
+    # The secret already in the shared volume, so bulk-created hooks all verify against
+    # one secret; a new one is generated only if there is none yet
+    try:
+        with open(SECRET_FILE) as f:
+            existing = f.read().strip()
+        if existing:
+            return existing
+    except FileNotFoundError:
+        pass
+    webhook_secret = secrets.token_hex(20)
+    store_secret(webhook_secret)
+    return webhook_secret
+
+
+@app.post("/create-webhook")
+async def create_webhook(request: Request):
+    data = await request.json()
+
+    check_auth(request)
+
+    repo_url = data.get('repo_url')
+    access_token = data.get('access_token')
+
+    if not repo_url or not access_token:
+        raise HTTPException(status_code=400, detail="Missing parameters")
+
+    # Extract owner and repo from repo_url
+    try:
+        owner, repo = parse_repo(repo_url)
+    except (ValueError, AttributeError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid repository URL")
+
+    # The receiver verifies every delivery against the one shared secret, so a new hook
+    # uses it too; /rotate-webhook-secret is the only place it changes
+    webhook_secret = shared_secret()
+
     # Create the webhook via GitHub API
-    response = requests.post(
-        f'https://api.github.com/repos/{owner}/{repo}/hooks',
-        headers=headers,
-        json=payload
-    )
+    response = await github.create_hook(owner, repo, access_token, hook_payload(webhook_url(), webhook_secret))
 
     if response.status_code == 201:
         return JSONResponse(content={'message': 'Webhook created successfully'}, status_code=201)
     else:
         return JSONResponse(content={'error': response.json()}, status_code=response.status_code)
+
+
+async def provision(owner, repo, access_token, payload):
+    # Creates the hook unless one already points at our receiver; returns the result line
+    result = {'repo': f'{owner}/{repo}'}
+    try:
+        hooks = await github.list_hooks(owner, repo, access_token)
+        if any(hook.get('config', {}).get('url') == payload['config']['url'] for hook in hooks):
+            return dict(result, status='exists')
+        response = await github.create_hook(owner, repo, access_token, payload)
+        if response.status_code == 201:
+            return dict(result, status='created', hook_id=response.json().get('id'))
+        raise GitHubError(response.status_code, response_body(response))
+    except GitHubError as e:
+        return dict(result, status='error', status_code=e.status_code, error=e.body)
+    except Exception as e:
+        logger.exception(f"Error creating webhook for {owner}/{repo}")
+        return dict(result, status='error', error=str(e))
+
+
+@app.post("/create-webhooks")
+async def create_webhooks(request: Request):
+    # Bulk variant: {"access_token": ..., "repos": [<url or owner/repo>, ...]} or
+    # {"access_token": ..., "org": <name>}. Hooks are created concurrently and one JSON
+    # line per repository is streamed back as soon as it is done, then a summary line.
+    data = await request.json()
+
+    check_auth(request)
+
+    access_token = data.get('access_token')
+    if not access_token or not (data.get('repos') or data.get('org')):
+        raise HTTPException(status_code=400, detail="Missing parameters")
+    try:
+        targets, invalid = await resolve_targets(data, access_token)
+    except GitHubError as e:
+        return JSONResponse(content={'error': e.body}, status_code=e.status_code)
+    payload = hook_payload(webhook_url(), shared_secret())
+
+    return StreamingResponse(stream_results('Bulk webhook creation', targets, invalid,
+                                            lambda owner, repo: provision(owner, repo, access_token, payload)),
+                             media_type="application/x-ndjson")
+
+
+async def resolve_targets(data, access_token):
+    # (owner, repo) pairs from "repos" and/or all repositories of "org", and the entries
+    # of "repos" that could not be parsed. GitHubError if the org cannot be listed.
+    targets = []
+    invalid = []
+    for repo in data.get('repos') or []:
+        try:
+            targets.append(parse_repo(repo))
+        except (ValueError, AttributeError, TypeError):
+            invalid.append(repo)
+    org = data.get('org')
+    if org:
+        try:
+            targets.extend(parse_repo(full_name) for full_name in await github.list_org_repos(org, access_token))
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Could not list repositories of {org}: {e}")
+    return list(dict.fromkeys(targets)), invalid
+
+
+async def stream_results(operation, targets, invalid, handle, on_done=None):
+    # Runs handle(owner, repo) for every target concurrently and yields one JSON line per
+    # repository as soon as it is done, then a summary line
+    counts = {}
+    for repo in invalid:
+        counts['invalid'] = counts.get('invalid', 0) + 1
+        yield json.dumps({'repo': repo, 'status': 'invalid', 'error': 'Invalid repository URL'}) + "\n"
+    tasks = [asyncio.ensure_future(handle(owner, repo)) for owner, repo in targets]
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            yield json.dumps(result) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+    summary = {'summary': counts, 'repositories': len(targets) + len(invalid)}
+    if on_done is not None:
+        summary.update(on_done(counts))
+    logger.info(f"{operation} for {len(targets)} repositories: {counts}")
+    yield json.dumps(summary) + "\n"
+
+
+async def update_secret(owner, repo, access_token, url, config):
+    # Points the repository's hook for our receiver at the new secret; returns the result line
+    result = {'repo': f'{owner}/{repo}'}
+    try:
+        hooks = [hook for hook in await github.list_hooks(owner, repo, access_token)
+                 if hook.get('config', {}).get('url') == url]
+        if not hooks:
+            return dict(result, status='no_hook')
+        for hook in hooks:
+            response = await github.update_hook_config(owner, repo, access_token, hook['id'], config)
+            if response.status_code != 200:
+                raise GitHubError(response.status_code, response_body(response))
+        return dict(result, status='updated', hook_ids=[hook['id'] for hook in hooks])
+    except GitHubError as e:
+        return dict(result, status='error', status_code=e.status_code, error=e.body)
+    except Exception as e:
+        logger.exception(f"Error updating the webhook secret of {owner}/{repo}")
+        return dict(result, status='error', error=str(e))
+
+
+@app.post("/rotate-webhook-secret")
+async def rotate_webhook_secret(request: Request):
+    # {"access_token": ..., "repos": [...]} and/or {"org": ...}: generates a new shared
+    # secret, sets it on every existing hook for our receiver in those repositories and
+    # then stores it for the receiver. Hooks in repositories left out, or whose update
+    # fails, keep the old secret and fail verification until they are updated.
+    data = await request.json()
+
+    check_auth(request)
+
+    access_token = data.get('access_token')
+    if not access_token or not (data.get('repos') or data.get('org')):
+        raise HTTPException(status_code=400, detail="Missing parameters")
+    try:
+        targets, invalid = await resolve_targets(data, access_token)
+    except GitHubError as e:
+        return JSONResponse(content={'error': e.body}, status_code=e.status_code)
+    url = webhook_url()
+    webhook_secret = secrets.token_hex(20)
+    config = hook_payload(url, webhook_secret)['config']
+
+    def store(counts):
+        # Stored last, so deliveries keep verifying while the hooks are being updated
+        store_secret(webhook_secret)
+        return {'secret_rotated': True}
+
+    return StreamingResponse(stream_results('Webhook secret rotation', targets, invalid,
+                                            lambda owner, repo: update_secret(owner, repo, access_token, url, config),
+                                            store),
+                             media_type="application/x-ndjson")
@@ -0,0 +1,140 @@
+import asyncio
+import email.utils
+import logging
+import os
+import re
+import time
+
+import httpx
+
+logger = logging.getLogger("uvicorn.error")
+
+# Overridable so the service can be pointed at GitHub Enterprise or a local mock server
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip('/')
+# Requests in flight at once; GitHub's secondary rate limits punish large bursts
+GITHUB_CONCURRENCY = int(os.getenv("GITHUB_CONCURRENCY", "8"))
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "5"))
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "30"))
+# New requests wait for the rate limit reset once fewer than this many calls are left
+RATE_LIMIT_RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "10"))
+# Longest pause taken for a rate limit before giving up on the request
+MAX_RATE_LIMIT_WAIT = float(os.getenv("GITHUB_MAX_RATE_LIMIT_WAIT", "900"))
+
+
+class GitHubError(Exception):
+    def __init__(self, status_code, body):
+        super().__init__(f"GitHub API returned {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class GitHubClient:
+    # One pooled HTTP/1.1 keep-alive client for every GitHub call the service makes.
+    # At most `concurrency` requests run at once. When GitHub reports the rate limit
+    # as nearly used up, or asks to back off with Retry-After, all requests pause.
+
+    def __init__(self, base_url=GITHUB_API_URL, concurrency=GITHUB_CONCURRENCY, timeout=GITHUB_TIMEOUT):
+        self.base_url = base_url
+        self._client = httpx.AsyncClient(
+            base_url=base_url, timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            headers={'Accept': 'application/vnd.github+json', 'X-GitHub-Api-Version': '2022-11-28'})
+        self._slots = asyncio.Semaphore(concurrency)
+        self._resume_at = 0.0  # time.time() before which no request is sent
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def request(self, method, path, token, **kwargs):
+        headers = {'Authorization': f'token {token}'}
+        for attempt in range(GITHUB_MAX_RETRIES + 1):
+            async with self._slots:
+                await self._wait_for_rate_limit()
+                try:
+                    response = await self._client.request(method, path, headers=headers, **kwargs)
+                except httpx.TransportError as e:
+                    if attempt == GITHUB_MAX_RETRIES:
+                        raise
+                    logger.warning(f"{method} {path} failed ({e}), retrying")
+                    await asyncio.sleep(min(2 ** attempt, 30))
+                    continue
+                wait = self._observe_rate_limit(response)
+            if wait is None or attempt == GITHUB_MAX_RETRIES:
+                return response
+            # Sleeping outside the semaphore so the pause is shared, not serialized
+            logger.warning(f"{method} {path} rate limited ({response.status_code}), retrying in {wait:.0f}s")
+            await asyncio.sleep(wait)
+        return response
+
+    async def _wait_for_rate_limit(self):
+        delay = self._resume_at - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _observe_rate_limit(self, response):
+        # Returns how long to wait before retrying, or None if the response stands
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        reset_wait = max(0.0, float(reset) - time.time()) + 1 if reset and reset.isdigit() else 60.0
+        if remaining is not None and remaining.isdigit() and int(remaining) < RATE_LIMIT_RESERVE:
+            self._pause(min(reset_wait, MAX_RATE_LIMIT_WAIT))
+
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = headers.get('Retry-After')
+        if retry_after:
+            wait = _parse_retry_after(retry_after)
+        elif remaining == '0':
+            wait = reset_wait
+        else:
+            return None  # an ordinary 403: missing permissions
+        wait = min(wait, MAX_RATE_LIMIT_WAIT)
+        self._pause(wait)
+        return wait
+
+    def _pause(self, seconds):
+        self._resume_at = max(self._resume_at, time.time() + seconds)
+
+    async def get_paginated(self, path, token, **params):
+        # Follows the Link: rel="next" headers, 100 items per page
+        items = []
+        url, params = path, dict(params, per_page=100)
+        while url:
+            response = await self.request('GET', url, token, params=params)
+            if response.status_code != 200:
+                raise GitHubError(response.status_code, response_body(response))
+            items.extend(response.json())
+            match = re.search(r'<([^>]+)>;\s*rel="next"', response.headers.get('Link', ''))
+            url, params = (match.group(1), None) if match else (None, None)
+        return items
+
+    async def list_org_repos(self, org, token):
+        return [repo['full_name'] for repo in await self.get_paginated(f'/orgs/{org}/repos', token, type='all')
+                if not repo.get('archived')]
+
+    async def list_hooks(self, owner, repo, token):
+        return await self.get_paginated(f'/repos/{owner}/{repo}/hooks', token)
+
+    async def create_hook(self, owner, repo, token, payload):
+        return await self.request('POST', f'/repos/{owner}/{repo}/hooks', token, json=payload)
+
+    async def update_hook_config(self, owner, repo, token, hook_id, config):
+        return await self.request('PATCH', f'/repos/{owner}/{repo}/hooks/{hook_id}/config', token, json=config)
+
+
+def _parse_retry_after(value):
+    # Seconds, or an HTTP date
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 60.0
+
+
+def response_body(response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
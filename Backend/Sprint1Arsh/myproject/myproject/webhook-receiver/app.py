@@ -1,82 +1,205 @@
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
-import subprocess
-from git import Repo
 import shutil
 import logging
+import time
+
+from git_objects import diff_trees, write_blobs
+from job_queue import JobQueue
+from mirror_cache import ZERO_COMMIT, MirrorCache
+from push_coalescer import DeliveryLog, PushCoalescer
 
 app = FastAPI()
 logger = logging.getLogger("uvicorn.error")
 
+# Shared with the binary analysis service: every push is written to staging/<batch_id>
+# and then renamed into ready/<batch_id>, which is what the analysis side watches
+BATCH_ROOT = os.getenv("BATCH_ROOT", "/shared/batches")
+# git pathspecs of the files sent to the analysis, e.g. "*.c :(exclude)vendor/"
+SOURCE_PATHSPECS = os.getenv("SOURCE_PATHSPECS", "*.c").split()
+
+jobs = JobQueue()
+mirrors = MirrorCache()
+deliveries = DeliveryLog()
+# Bursts of pushes to one branch reach the workers as a single before..after range
+# Pushes to one repository run one after another (they share its mirror); different
+# repositories are processed in parallel
+coalescer = PushCoalescer(lambda job_id, push: jobs.submit(job_id, process_push, push, key=push['repo_name']))
+
+
+@app.on_event("startup")
+def start_workers():
+    jobs.start()
+    coalescer.start()
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    coalescer.stop()
+    jobs.stop()
+
+
+def parse_push(payload):
+    # Returns the fields process_push needs, or raises HTTPException(422) naming what is missing
+    try:
+        repository = payload['repository']
+        push = {
+            'repo_url': repository['clone_url'],
+            'repo_name': repository['name'],
+            'default_branch': repository['default_branch'],
+            'ref': payload.get('ref'),
+            'current_commit': payload['after'],
+            'parent_commit': payload['before'],
+        }
+    except (KeyError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Not a push payload, missing {e}")
+    if not all(isinstance(push[key], str) and push[key] for key in
+               ('repo_url', 'repo_name', 'default_branch', 'current_commit', 'parent_commit')):
+        raise HTTPException(status_code=422, detail="Not a push payload")
+    if os.sep in push['repo_name'] or push['repo_name'] in ('.', '..'):
+        raise HTTPException(status_code=422, detail=f"Invalid repository name {push['repo_name']!r}")
+    return push
+
+
 @app.post("/webhook")
 async def webhook(request: Request):
-    payload = await request.json()
-    logger.info(f"Received payload: {payload}")
+    # Only validates and enqueues; GitHub gives up on deliveries after 10 seconds, so the
+    # clone and checkouts happen in the worker pool and the response is a 202
+    event = request.headers.get('X-GitHub-Event', 'push')
+    delivery = request.headers.get('X-GitHub-Delivery')
+    if event == 'ping':
+        return {"message": "pong"}
+    if event != 'push':
+        return JSONResponse(status_code=202, content={"message": f"Ignored {event} event"})
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body is not JSON")
+    push = parse_push(payload)
+    if payload.get('deleted') or push['current_commit'] == ZERO_COMMIT:
+        return JSONResponse(status_code=202, content={"message": "Branch deleted, nothing to analyze"})
+    if deliveries.seen(delivery):
+        logger.info(f"Ignored redelivery {delivery}")
+        return {"message": "Duplicate delivery", "delivery": delivery}
+    logger.info(f"Received push {delivery} for {push['repo_name']} "
+                f"{push['parent_commit'][:12]}..{push['current_commit'][:12]}")
+
+    if jobs.depth >= jobs.maxsize:
+        deliveries.forget(delivery)
+        logger.warning(f"Rejected push {delivery}: webhook queue is full")
+        raise HTTPException(status_code=503, detail="Webhook queue is full", headers={"Retry-After": "30"})
+    pushes = coalescer.add(push, delivery or '-')
+    return JSONResponse(status_code=202, content={"message": "Push queued", "delivery": delivery,
+                                                  "coalesced_pushes": pushes, "queue_depth": jobs.depth})
+
+
+@app.get("/status")
+def status():
+    return dict(jobs.status(), **mirrors.status(), pending_pushes=coalescer.depth,
+                coalesced_pushes=coalescer.coalesced, duplicate_deliveries=deliveries.duplicates)
 
-    repo_url = payload['repository']['clone_url']
-    repo_name = payload['repository']['name']
-    commits = payload['commits']
-    default_branch = payload['repository']['default_branch']  # Get the default branch name
+
+@app.get("/metrics")
+def metrics():
+    lines = [
+        "# HELP webhook_pending_pushes Branches with pushes waiting out the debounce window.",
+        "# TYPE webhook_pending_pushes gauge",
+        f"webhook_pending_pushes {coalescer.depth}",
+        "# HELP webhook_coalesced_pushes_total Pushes merged into an earlier push to the same branch.",
+        "# TYPE webhook_coalesced_pushes_total counter",
+        f"webhook_coalesced_pushes_total {coalescer.coalesced}",
+        "# HELP webhook_duplicate_deliveries_total Redeliveries dropped by X-GitHub-Delivery id.",
+        "# TYPE webhook_duplicate_deliveries_total counter",
+        f"webhook_duplicate_deliveries_total {deliveries.duplicates}",
+    ]
+    return PlainTextResponse(jobs.render_metrics() + mirrors.render_metrics() + "\n".join(lines) + "\n",
+                             media_type="text/plain; version=0.0.4")
+
+
+def process_push(push):
+    # Every push gets its own batch directory named after its commit pair, so concurrent
+    # pushes never write to the same place and a range already waiting is not queued twice
+    pair = f"{push['repo_name']}-{push['parent_commit'][:12]}-{push['current_commit'][:12]}"
+    ready_dir = os.path.join(BATCH_ROOT, 'ready')
+    os.makedirs(ready_dir, exist_ok=True)
+    if any(name.endswith(f"-{pair}") for name in os.listdir(ready_dir)):
+        logger.info(f"Batch for {pair} is already waiting for analysis")
+        return
+    # Timestamp first so batch ids sort in arrival order
+    batch_id = f"{time.time_ns()}-{pair}"
+    staging_dir = os.path.join(BATCH_ROOT, 'staging', batch_id)
+    try:
+        changed_files = extract_push(push, staging_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # Publish the batch: the rename is atomic, so the analysis service never sees a half-written push
+    if changed_files:
+        os.rename(staging_dir, os.path.join(ready_dir, batch_id))
+        logger.info(f"Queued batch {batch_id} with {len(changed_files)} C files")
+    else:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def flat_names(paths):
+    # version1/ and version2/ are flat directories. A file keeps its basename unless
+    # another changed file has the same one; those get their repository path with
+    # '/' replaced by '__', so neither overwrites the other.
+    by_name = {}
+    for path in paths:
+        by_name.setdefault(os.path.basename(path), []).append(path)
+    names = {}
+    for name, group in by_name.items():
+        if len(group) == 1:
+            names[group[0]] = name
+            continue
+        logger.warning(f"{len(group)} changed files are named {name} ({', '.join(group)}), "
+                       f"naming them by path")
+        for path in group:
+            names[path] = path.replace('/', '__')
+    return names
+
+
+def extract_push(push, staging_dir):
+    # Writes version1/ and version2/ of the changed C files into staging_dir and
+    # returns the changed paths
+    repo_url = push['repo_url']
+    repo_name = push['repo_name']
 
     # Get the current and previous commits from 'after' and 'before'
-    current_commit = payload['after']
-    parent_commit = payload['before']
+    current_commit = push['current_commit']
+    parent_commit = push['parent_commit']
 
-    # Paths
-    shared_dir = '/shared'
-    repo_path = os.path.join(shared_dir, 'repos', repo_name)
-    version1_dir = os.path.join(shared_dir, 'c_source', 'version1')
-    version2_dir = os.path.join(shared_dir, 'c_source', 'version2')
+    version1_dir = os.path.join(staging_dir, 'version1')
+    version2_dir = os.path.join(staging_dir, 'version2')
 
     # Ensure directories exist
     os.makedirs(version1_dir, exist_ok=True)
     os.makedirs(version2_dir, exist_ok=True)
 
-    # Clone or pull the repository
-    if os.path.exists(repo_path):
-        repo = Repo(repo_path)
-        origin = repo.remotes.origin
-        # Ensure we are on the default branch before pulling
-        repo.git.checkout(default_branch)
-        origin.pull()
-    else:
-        repo = Repo.clone_from(repo_url, repo_path)
-
-    # Identify changed C files
-    changed_files = set()
-    for commit_data in commits:
-        for file_path in commit_data.get('modified', []):
-            if file_path.endswith('.c'):
-                changed_files.add(file_path)
-
-    # Process each changed file
-    for file_path in changed_files:
-        # Checkout previous commit and save the file
-        repo.git.checkout(parent_commit)
-        prev_file = os.path.join(repo_path, file_path)
-        if os.path.exists(prev_file):
-            shutil.copy(prev_file, os.path.join(version1_dir, os.path.basename(file_path)))
-        else:
-            # If file didn't exist in previous commit, create an empty file
-            open(os.path.join(version1_dir, os.path.basename(file_path)), 'w').close()
-
-        # Checkout current commit and save the file
-        repo.git.checkout(current_commit)
-        curr_file = os.path.join(repo_path, file_path)
-        if os.path.exists(curr_file):
-            shutil.copy(curr_file, os.path.join(version2_dir, os.path.basename(file_path)))
-        else:
-            # If file was deleted in current commit, create an empty file
-            open(os.path.join(version2_dir, os.path.basename(file_path)), 'w').close()
-
-    # Reset to default branch
-    repo.git.checkout(default_branch)  # Use the default branch from the payload
-
-    # Invoke the binary analysis module
-    # try:
-    #     subprocess.check_call(["python", "/app/module_script.py"])
-    # except subprocess.CalledProcessError as e:
-    #     logger.error(f"Binary analysis failed: {e}")
-    #     raise HTTPException(status_code=500, detail="Binary analysis failed")
-
-    return {"message": "Webhook processed and binary analysis triggered"}
+    # Changed files come from one diff of the before and after trees rather than the
+    # payload's commit list, which GitHub truncates for large pushes and which does not
+    # survive coalescing. Renamed files keep their old contents in version1.
+    with mirrors.use(repo_name, repo_url) as git_dir:
+        # Only the two commits named in the payload and then the changed blobs are fetched
+        mirrors.fetch_commits(repo_name, git_dir, [parent_commit, current_commit], push['ref'])
+        base = mirrors.diff_base(git_dir, parent_commit, current_commit)
+        changes = diff_trees(git_dir, base, current_commit, SOURCE_PATHSPECS)
+
+        # Before and after contents of every changed file in one `git cat-file --batch` stream;
+        # a file missing on one side (added or deleted) becomes an empty file there
+        targets = []
+        names = flat_names([new_path or old_path for _, old_path, new_path in changes])
+        for _, old_path, new_path in changes:
+            name = names[new_path or old_path]
+            targets.append((base, old_path or new_path, os.path.join(version1_dir, name)))
+            targets.append((current_commit, new_path or old_path, os.path.join(version2_dir, name)))
+        mirrors.fetch_blobs(repo_name, git_dir, [(revision, path) for revision, path, _ in targets])
+        extracted_bytes = write_blobs(git_dir, targets)
+    renames = sum(1 for status, _, _ in changes if status == 'R')
+    logger.info(f"{repo_name} {base[:12]}..{current_commit[:12]}: {len(changes)} changed files "
+                f"({renames} renamed), {extracted_bytes} bytes extracted")
+
+    return {new_path or old_path for _, old_path, new_path in changes}
@@ -0,0 +1,93 @@
+import logging
+import subprocess
+import threading
+
+logger = logging.getLogger("uvicorn.error")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def write_blobs(repo_path, targets):
+    # targets: list of (revision, path in repo, output file). All blobs are read from the
+    # object database through one `git cat-file --batch` process, without touching any
+    # worktree. A path missing at its revision (added or deleted file) gets an empty
+    # output file. Returns the number of bytes written.
+    process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=repo_path,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Requests are written from a thread so a large answer can never block the writer
+    def send_requests():
+        try:
+            for revision, path, _ in targets:
+                process.stdin.write(f"{revision}:{path}\n".encode())
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    writer = threading.Thread(target=send_requests, daemon=True)
+    writer.start()
+    written = 0
+    try:
+        for revision, path, output_file in targets:
+            header = process.stdout.readline().decode()
+            if not header:
+                raise RuntimeError(f"git cat-file exited early: {process.stderr.read().decode().strip()}")
+            fields = header.split()
+            if fields[-1] == 'missing' or fields[1] != 'blob':
+                # Not in this revision, or not a regular file there (e.g. a submodule)
+                open(output_file, 'wb').close()
+                if fields[-1] != 'missing':
+                    _skip(process.stdout, int(fields[2]) + 1)
+                continue
+            written += _copy(process.stdout, output_file, int(fields[2]))
+            process.stdout.read(1)  # newline after the contents
+    finally:
+        writer.join()
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+    return written
+
+
+def _copy(stream, output_file, size):
+    remaining = size
+    with open(output_file, 'wb') as f:
+        while remaining:
+            chunk = stream.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise RuntimeError(f"git cat-file output ended {remaining} bytes early")
+            f.write(chunk)
+            remaining -= len(chunk)
+    return size
+
+
+def _skip(stream, size):
+    while size:
+        chunk = stream.read(min(COPY_CHUNK_SIZE, size))
+        if not chunk:
+            return
+        size -= len(chunk)
+
+
+def diff_trees(repo_path, before, after, pathspecs):
+    # Changed files between two commits (or trees) from a single `git diff-tree`, with
+    # rename detection. Returns (status, old path, new path) tuples; status is the
+    # diff-tree letter (A, M, D, T or R), old path is None for additions and new path
+    # None for deletions.
+    result = subprocess.run(['git', 'diff-tree', '-r', '-z', '-M', '--no-commit-id', '--name-status',
+                             before, after, '--', *pathspecs], cwd=repo_path, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git diff-tree {before[:12]} {after[:12]} failed: {result.stderr.decode().strip()}")
+    fields = result.stdout.decode(errors='surrogateescape').split('\0')
+    changes = []
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i][0]
+        if status in 'RC':
+            changes.append((status, fields[i + 1], fields[i + 2]))
+            i += 3
+            continue
+        path = fields[i + 1]
+        changes.append((status, None if status == 'A' else path, None if status == 'D' else path))
+        i += 2
+    return changes
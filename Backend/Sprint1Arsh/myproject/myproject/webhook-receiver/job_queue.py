@@ -0,0 +1,196 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("uvicorn.error")
+
+# Pushes accepted but not yet picked up by a worker; deliveries beyond this are refused
+# with 503 so GitHub retries them later instead of them piling up in memory
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "256"))
+# Threads doing the git work; each runs one push at a time
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name):
+        lines = [f'{name}_bucket{{le="{bound}"}} {count}' for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum:.6f}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+class Job:
+    def __init__(self, job_id, handler, args, key):
+        self.job_id = job_id
+        self.handler = handler
+        self.args = args
+        self.key = key
+        self.enqueued = time.monotonic()
+
+
+class JobQueue:
+    # Bounded queue drained by a fixed pool of worker threads. The request handler only
+    # calls submit(), which never blocks; the blocking git work happens in the workers.
+    # Jobs submitted with the same key (a repository) run one at a time in submission
+    # order, without holding a worker while they wait; different keys run in parallel.
+
+    def __init__(self, maxsize=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_WORKERS):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._ready = queue.Queue()  # jobs a worker may start now
+        self._waiting = {}           # key -> deque of jobs behind the running one
+        self._busy_keys = set()      # keys with a job ready or running
+        self._queued = 0             # jobs not yet started, ready or waiting
+        self._threads = []
+        self._lock = threading.Lock()
+        self.in_progress = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds = Histogram()    # enqueue -> picked up by a worker
+        self.job_seconds = Histogram()     # picked up -> finished
+        self.latency_seconds = Histogram()  # enqueue -> finished
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} webhook workers (queue size {self.maxsize})")
+
+    def stop(self, timeout=30):
+        # Lets queued jobs finish, then ends the workers
+        deadline = time.monotonic() + timeout
+        while (self._queued or self.in_progress) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, job_id, handler, *args, key=None):
+        job = Job(job_id, handler, args, key)
+        with self._lock:
+            if self._queued >= self.maxsize:
+                self.rejected += 1
+                raise QueueFull(f"Webhook queue is full ({self.maxsize} jobs)")
+            self._queued += 1
+            if key is not None:
+                if key in self._busy_keys:
+                    self._waiting.setdefault(key, deque()).append(job)
+                    return
+                self._busy_keys.add(key)
+        self._ready.put(job)
+
+    @property
+    def depth(self):
+        return self._queued
+
+    def _release(self, key):
+        # Hands the key's next job to the workers, or frees the key
+        with self._lock:
+            waiting = self._waiting.get(key)
+            if not waiting:
+                self._busy_keys.discard(key)
+                return
+            job = waiting.popleft()
+            if not waiting:
+                del self._waiting[key]
+        self._ready.put(job)
+
+    def _work(self):
+        while True:
+            job = self._ready.get()
+            if job is None:
+                return
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self.in_progress += 1
+                self.wait_seconds.observe(started - job.enqueued)
+            succeeded = False
+            try:
+                job.handler(*job.args)
+                succeeded = True
+            except Exception:
+                logger.exception(f"Webhook job {job.job_id} failed")
+            finally:
+                finished = time.monotonic()
+                with self._lock:
+                    self.in_progress -= 1
+                    if succeeded:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self.job_seconds.observe(finished - started)
+                    self.latency_seconds.observe(finished - job.enqueued)
+                if job.key is not None:
+                    self._release(job.key)
+                logger.info(f"Webhook job {job.job_id} {'done' if succeeded else 'failed'} in "
+                            f"{finished - started:.2f}s after waiting {started - job.enqueued:.2f}s")
+
+    def status(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queued,
+                'queue_size': self.maxsize,
+                'workers': self.workers,
+                'busy_repositories': len(self._busy_keys),
+                'in_progress': self.in_progress,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def render_metrics(self):
+        # Prometheus text exposition for GET /metrics
+        status = self.status()
+        lines = [
+            "# HELP webhook_queue_depth Pushes waiting for a worker.",
+            "# TYPE webhook_queue_depth gauge",
+            f"webhook_queue_depth {status['queue_depth']}",
+            "# HELP webhook_jobs_in_progress Pushes being processed.",
+            "# TYPE webhook_jobs_in_progress gauge",
+            f"webhook_jobs_in_progress {status['in_progress']}",
+            "# HELP webhook_busy_repositories Repositories with a push running or ready to run.",
+            "# TYPE webhook_busy_repositories gauge",
+            f"webhook_busy_repositories {status['busy_repositories']}",
+        ]
+        for name, help_text in (('completed', 'Pushes processed successfully.'),
+                                ('failed', 'Pushes whose processing raised an error.'),
+                                ('rejected', 'Deliveries refused because the queue was full.')):
+            lines.append(f"# HELP webhook_jobs_{name}_total {help_text}")
+            lines.append(f"# TYPE webhook_jobs_{name}_total counter")
+            lines.append(f"webhook_jobs_{name}_total {status[name]}")
+        with self._lock:
+            for name, histogram, help_text in (
+                    ('webhook_job_wait_seconds', self.wait_seconds, 'Time from delivery to a worker picking it up.'),
+                    ('webhook_job_duration_seconds', self.job_seconds, 'Time a worker spent on a push.'),
+                    ('webhook_job_latency_seconds', self.latency_seconds, 'Time from delivery to batch published.')):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                lines.extend(histogram.render(name))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,277 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from job_queue import Histogram
+
+logger = logging.getLogger("uvicorn.error")
+
+# Bare, blob-less partial clones of the monitored repositories, one <name>.git per repo
+MIRROR_ROOT = os.getenv("MIRROR_ROOT", "/shared/mirrors")
+# Least recently used mirrors are deleted once all of them together exceed this
+MIRROR_CACHE_MAX_BYTES = int(os.getenv("MIRROR_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+FETCH_TIMEOUT = int(os.getenv("MIRROR_FETCH_TIMEOUT", "600"))
+ZERO_COMMIT = '0' * 40
+# Object id of the empty tree, what a branch's first commit is compared with
+EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+
+class GitError(Exception):
+    pass
+
+
+def git(git_dir, *args, timeout=FETCH_TIMEOUT):
+    result = subprocess.run(['git', '--git-dir', git_dir, *args], capture_output=True, text=True,
+                            timeout=timeout)
+    if result.returncode != 0:
+        raise GitError(f"git {' '.join(args[:2])} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class FetchStats:
+    def __init__(self):
+        self.fetches = 0
+        self.failed = 0
+        self.bytes = 0
+        self.evicted = 0
+        self.seconds = Histogram()
+
+
+class MirrorCache:
+    # Fetches only what a push needs: the commits and trees of `before` and `after`
+    # (blob:none filter), then the blobs of the changed files in a single request.
+    # Blobs of unchanged files are never downloaded.
+
+    def __init__(self, root=MIRROR_ROOT, max_bytes=MIRROR_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stats = FetchStats()
+        self._sizes = {}   # mirror name -> bytes on disk after its last fetch
+        self._in_use = {}  # mirror name -> workers currently reading it
+        self._lock = threading.Lock()
+
+    def path_for(self, name):
+        return os.path.join(self.root, f"{name}.git")
+
+    @contextmanager
+    def use(self, name, url):
+        # Yields the git dir of the mirror; it is not evicted while in use
+        with self._lock:
+            self._in_use[name] = self._in_use.get(name, 0) + 1
+        try:
+            git_dir = self.path_for(name)
+            if not os.path.exists(os.path.join(git_dir, 'HEAD')):
+                self._create(git_dir, url)
+            else:
+                config = dict(line.split(' ', 1) for line in git(
+                    git_dir, 'config', '--get-regexp', r'^(remote\.origin\.url|gc\.auto)$').splitlines())
+                if config.get('remote.origin.url') != url:
+                    git(git_dir, 'remote', 'set-url', 'origin', url)
+                if 'gc.auto' in config:
+                    # Mirrors created when fetched commits were kept off any ref
+                    git(git_dir, 'config', '--unset', 'gc.auto')
+            os.utime(git_dir)  # last use, for the LRU order
+            yield git_dir
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+                if not self._in_use[name]:
+                    del self._in_use[name]
+
+    def _create(self, git_dir, url):
+        # Built under a temporary name so a half-initialised mirror is never picked up
+        tmp_dir = f"{git_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(os.path.dirname(git_dir), exist_ok=True)
+        subprocess.run(['git', 'init', '--quiet', '--bare', tmp_dir], check=True, capture_output=True)
+        for key, value in (('remote.origin.url', url),
+                           ('remote.origin.fetch', '+refs/heads/*:refs/heads/*'),
+                           ('remote.origin.promisor', 'true'),
+                           ('remote.origin.partialclonefilter', 'blob:none'),
+                           ('extensions.partialclone', 'origin'),
+                           ('core.repositoryformatversion', '1'),
+                           # Fetches add small packs; auto gc consolidates them in the
+                           # worker, while the mirror is marked in use
+                           ('gc.autoDetach', 'false')):
+            git(tmp_dir, 'config', key, value)
+        os.rename(tmp_dir, git_dir)
+        logger.info(f"Created mirror {git_dir} for {url}")
+
+    def fetch_commits(self, name, git_dir, commits, ref=None):
+        # Makes sure the commits (and their trees) are present. Commits GitHub reports
+        # as all zeros (branch created or deleted) are skipped. The last commit is stored
+        # on the pushed ref and the others on refs/mirror/base, so each fetch can tell
+        # the server what the mirror already has and only receives the new commits.
+        refspecs = []
+        for i, commit in enumerate(commits):
+            if not commit or commit == ZERO_COMMIT:
+                continue
+            target = (ref or 'refs/mirror/head') if i == len(commits) - 1 else 'refs/mirror/base'
+            if self.has_commit(git_dir, commit):
+                git(git_dir, 'update-ref', target, commit)
+            else:
+                refspecs.append(f"+{commit}:{target}")
+        if not refspecs:
+            return
+        try:
+            self._fetch(name, git_dir, refspecs)
+        except GitError as e:
+            # Servers that refuse fetching by object id still serve the pushed branch
+            logger.warning(f"Fetching {len(refspecs)} commits of {name} by id failed, fetching refs: {e}")
+            self._fetch(name, git_dir, [f"+{ref}:{ref}"] if ref else ['+refs/heads/*:refs/heads/*'])
+
+    def fetch_blobs(self, name, git_dir, revision_paths):
+        # revision_paths: list of (revision, path). Resolves their blob ids from the
+        # trees and downloads the missing ones in one request, instead of git fetching
+        # them lazily one round-trip per blob.
+        blob_ids = set()
+        for revision in {revision for revision, _ in revision_paths}:
+            if not self.has_commit(git_dir, revision):
+                continue
+            paths = [path for rev, path in revision_paths if rev == revision]
+            for entry in git(git_dir, 'ls-tree', '-z', revision, '--', *paths).split('\0'):
+                if entry:
+                    _, kind, object_id = entry.split('\t', 1)[0].split()
+                    if kind == 'blob':
+                        blob_ids.add(object_id)
+        missing = [object_id for object_id in sorted(blob_ids)
+                   if not self._has_object(git_dir, object_id, objects=True)]
+        if missing:
+            # Blobs are wanted by id; there is nothing for the server to negotiate
+            self._fetch(name, git_dir, missing, negotiate=False)
+
+    def diff_base(self, git_dir, before, after):
+        # What `after` is compared with. Normally `before`, including after a force-push
+        # (two trees diff fine without a common history). A new branch (before all
+        # zeros) or a `before` the server no longer has is compared with the first
+        # parent of `after`, and a root commit with the empty tree.
+        if self.has_commit(git_dir, before):
+            return before
+        if before and before != ZERO_COMMIT:
+            logger.warning(f"{before[:12]} is not available, comparing {after[:12]} with its parent")
+        result = subprocess.run(['git', '--git-dir', git_dir, 'rev-parse', '--verify', '--quiet',
+                                 f"{after}^1"], capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else EMPTY_TREE
+
+    def has_commit(self, git_dir, commit):
+        if not commit or commit == ZERO_COMMIT:
+            return False
+        return self._has_object(git_dir, f"{commit}^{{commit}}")
+
+    def _has_object(self, git_dir, object_name, objects=False):
+        # Local lookup only: plain cat-file would fetch a missing object from the promisor
+        # remote, rev-list with --missing never does
+        args = ['git', '--git-dir', git_dir, 'rev-list', '--missing=allow-any', '--no-walk']
+        result = subprocess.run(args + (['--objects'] if objects else []) + [object_name], capture_output=True)
+        return result.returncode == 0
+
+    def _fetch(self, name, git_dir, refspecs, negotiate=True):
+        before = directory_size(os.path.join(git_dir, 'objects'))
+        start = time.monotonic()
+        options = [] if negotiate else ['-c', 'fetch.negotiationAlgorithm=noop']
+        try:
+            git(git_dir, *options, 'fetch', '--quiet', '--no-tags',
+                '--no-write-fetch-head', '--filter=blob:none', 'origin', *refspecs)
+        except (GitError, subprocess.TimeoutExpired) as e:
+            with self._lock:
+                self.stats.failed += 1
+            raise GitError(str(e)) from e
+        elapsed = time.monotonic() - start
+        size = directory_size(git_dir)
+        fetched = max(0, directory_size(os.path.join(git_dir, 'objects')) - before)
+        with self._lock:
+            self.stats.fetches += 1
+            self.stats.bytes += fetched
+            self.stats.seconds.observe(elapsed)
+            self._sizes[name] = size
+        logger.info(f"Fetched {len(refspecs)} refspecs for {name}: {fetched} bytes in {elapsed:.2f}s "
+                    f"(mirror {size} bytes)")
+        self.evict()
+
+    def evict(self):
+        # Deletes least recently used mirrors, never one a worker is reading
+        if not os.path.isdir(self.root):
+            return
+        mirrors = []
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.name.endswith('.git'):
+                name = entry.name[:-len('.git')]
+                with self._lock:
+                    known = name in self._sizes
+                # Sized outside the lock; only mirrors this process has not seen yet
+                size = None if known else directory_size(entry.path)
+                mirrors.append((entry.stat().st_mtime, name, entry.path, size))
+
+        evicted = []
+        with self._lock:
+            for _, name, _, size in mirrors:
+                if size is not None:
+                    self._sizes.setdefault(name, size)
+            total = sum(self._sizes.get(name, 0) for _, name, _, _ in mirrors)
+            for _, name, path, _ in sorted(mirrors):
+                if total <= self.max_bytes:
+                    break
+                if name in self._in_use:
+                    continue
+                # Renamed first so a concurrent use() recreates it rather than reading a half-deleted mirror
+                doomed = f"{path}.evicted-{time.time_ns()}"
+                try:
+                    os.rename(path, doomed)
+                except FileNotFoundError:
+                    # Already evicted by another worker
+                    self._sizes.pop(name, None)
+                    continue
+                total -= self._sizes.pop(name, 0)
+                self.stats.evicted += 1
+                evicted.append((name, doomed, total))
+        for name, doomed, remaining in evicted:
+            shutil.rmtree(doomed, ignore_errors=True)
+            logger.info(f"Evicted mirror {name}, cache now {remaining} bytes")
+
+    def status(self):
+        with self._lock:
+            return {
+                'mirrors': len(self._sizes),
+                'mirror_bytes': sum(self._sizes.values()),
+                'fetches': self.stats.fetches,
+                'fetch_failures': self.stats.failed,
+                'fetched_bytes': self.stats.bytes,
+                'evicted': self.stats.evicted,
+            }
+
+    def render_metrics(self):
+        status = self.status()
+        lines = [
+            "# HELP mirror_cache_bytes Disk used by the repository mirrors.",
+            "# TYPE mirror_cache_bytes gauge",
+            f"mirror_cache_bytes {status['mirror_bytes']}",
+            "# HELP mirror_fetched_bytes_total Object bytes downloaded by mirror fetches.",
+            "# TYPE mirror_fetched_bytes_total counter",
+            f"mirror_fetched_bytes_total {status['fetched_bytes']}",
+            "# HELP mirror_fetch_failures_total Mirror fetches that failed.",
+            "# TYPE mirror_fetch_failures_total counter",
+            f"mirror_fetch_failures_total {status['fetch_failures']}",
+            "# HELP mirror_evictions_total Mirrors deleted to stay within the disk budget.",
+            "# TYPE mirror_evictions_total counter",
+            f"mirror_evictions_total {status['evicted']}",
+            "# HELP mirror_fetch_duration_seconds Duration of mirror fetches.",
+            "# TYPE mirror_fetch_duration_seconds histogram",
+        ]
+        with self._lock:
+            lines.extend(self.stats.seconds.render('mirror_fetch_duration_seconds'))
+        return "\n".join(lines) + "\n"
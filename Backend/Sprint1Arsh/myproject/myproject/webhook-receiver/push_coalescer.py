@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from job_queue import QueueFull
+
+logger = logging.getLogger("uvicorn.error")
+
+# A push is held this long after the last push to the same branch, so a burst of
+# pushes becomes one before..after range
+PUSH_DEBOUNCE_SECONDS = float(os.getenv("PUSH_DEBOUNCE_SECONDS", "5"))
+# ...but never longer than this after the first push of the burst
+PUSH_DEBOUNCE_MAX_SECONDS = float(os.getenv("PUSH_DEBOUNCE_MAX_SECONDS", "60"))
+# X-GitHub-Delivery ids remembered to drop redeliveries
+DELIVERY_DEDUPE_SIZE = int(os.getenv("DELIVERY_DEDUPE_SIZE", "10000"))
+DELIVERY_DEDUPE_TTL = float(os.getenv("DELIVERY_DEDUPE_TTL", str(24 * 3600)))
+
+
+class DeliveryLog:
+    # Recently seen delivery ids, bounded in number and age
+
+    def __init__(self, size=DELIVERY_DEDUPE_SIZE, ttl=DELIVERY_DEDUPE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.duplicates = 0
+        self._seen = OrderedDict()  # delivery id -> time first seen
+        self._lock = threading.Lock()
+
+    def seen(self, delivery):
+        # Records the delivery; True if it was already recorded
+        if not delivery:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._seen and (len(self._seen) >= self.size or
+                                  now - next(iter(self._seen.values())) > self.ttl):
+                self._seen.popitem(last=False)
+            if delivery in self._seen:
+                self.duplicates += 1
+                return True
+            self._seen[delivery] = now
+            return False
+
+    def forget(self, delivery):
+        # For deliveries that were not accepted after all, so GitHub's retry goes through
+        with self._lock:
+            self._seen.pop(delivery, None)
+
+
+class PendingPush:
+    def __init__(self, push, delivery, now):
+        self.push = dict(push)
+        self.deliveries = [delivery]
+        self.first = now
+        self.due = now
+
+    def merge(self, push, delivery):
+        # Keeps the oldest `before` and takes the newest `after`; the changed files of the
+        # whole range are what the analysis sees
+        self.push['current_commit'] = push['current_commit']
+        self.deliveries.append(delivery)
+
+
+class PushCoalescer:
+    # Holds pushes per (repository, ref) for a debounce window and hands the merged
+    # push to `submit` once the branch has been quiet for `window` seconds.
+
+    def __init__(self, submit, window=PUSH_DEBOUNCE_SECONDS, max_wait=PUSH_DEBOUNCE_MAX_SECONDS):
+        self.submit = submit
+        self.window = window
+        self.max_wait = max_wait
+        self.coalesced = 0
+        self._pending = {}  # (repo name, ref) -> PendingPush
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="push-coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Flushes what is still pending
+        with self._condition:
+            self._stopped = True
+            for pending in self._pending.values():
+                pending.due = 0
+            self._condition.notify()
+        self._thread.join()
+
+    def add(self, push, delivery):
+        key = (push['repo_name'], push['ref'] or push['current_commit'])
+        now = time.monotonic()
+        with self._condition:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = PendingPush(push, delivery, now)
+            else:
+                pending.merge(push, delivery)
+                self.coalesced += 1
+            pending.due = min(now + self.window, pending.first + self.max_wait)
+            self._condition.notify()
+        return len(pending.deliveries)
+
+    @property
+    def depth(self):
+        with self._condition:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = [key for key, pending in self._pending.items() if pending.due <= now]
+                    if due or (self._stopped and not self._pending):
+                        break
+                    next_due = min((pending.due for pending in self._pending.values()), default=None)
+                    self._condition.wait(None if next_due is None else next_due - now)
+                ready = [(key, self._pending.pop(key)) for key in due]
+            if not ready and self._stopped:
+                return
+            for key, pending in ready:
+                self._flush(key, pending)
+
+    def _flush(self, key, pending):
+        push = pending.push
+        job_id = ",".join(pending.deliveries)
+        try:
+            self.submit(job_id, push)
+        except QueueFull as e:
+            if self._stopped:
+                logger.error(f"Dropped {push['repo_name']} push {job_id} on shutdown: {e}")
+                return
+            # Worker queue full: keep the range and try again after another window,
+            # merging anything pushed meanwhile
+            logger.warning(f"Could not queue {push['repo_name']} push {job_id}, retrying: {e}")
+            with self._condition:
+                newer = self._pending.get(key)
+                if newer is not None:
+                    pending.merge(newer.push, ",".join(newer.deliveries))
+                pending.due = time.monotonic() + self.window
+                self._pending[key] = pending
+                self._condition.notify()
+            return
+        logger.info(f"Queued {push['repo_name']} {push['parent_commit'][:12]}..{push['current_commit'][:12]} "
+                    f"from {len(pending.deliveries)} pushes")
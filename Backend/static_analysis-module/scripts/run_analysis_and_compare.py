@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import argparse
 import subprocess
 import requests
@@ -8,6 +9,11 @@ import time
 import tempfile
 import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Function to source environment variables from a file
 def source_env_file(env_file_path):
@@ -41,6 +47,44 @@ SONARQUBE_FOLDER = os.path.abspath("../sonarqube")
 SOURCE_CODE_FOLDER = os.path.abspath("../source_code")
 SONARQUBE_REPORTS_FOLDER = os.path.join(SONARQUBE_FOLDER, "reports")
 
+# Number of scanner containers run at once (default: derived from CPUs and CE workers)
+SCANNER_WORKERS = int(os.getenv("SCANNER_WORKERS", "0"))
+# Scans allowed per compute engine worker; more would only queue up in the CE
+SCANS_PER_CE_WORKER = int(os.getenv("SCANS_PER_CE_WORKER", "4"))
+# Project that holds the whole source tree in single-pass mode
+SINGLE_PASS_PROJECT_KEY = os.getenv("SINGLE_PASS_PROJECT_KEY", "source_code")
+# /api/issues/search pages; it returns at most 10000 issues per query
+ISSUES_PAGE_SIZE = 500
+ISSUES_SEARCH_LIMIT = 10000
+# Issue searches in flight at once, for the whole run (all projects share them)
+ISSUE_FETCH_WORKERS = int(os.getenv("ISSUE_FETCH_WORKERS", "8"))
+# How long to wait for the compute engine to process one analysis report
+CE_TASK_TIMEOUT = int(os.getenv("CE_TASK_TIMEOUT", "600"))
+
+# Serializes output from the scanner threads
+print_lock = threading.Lock()
+# Limits the scanner containers running at once; set by run_sonarqube_analysis
+scanner_slots = threading.Semaphore(1)
+
+
+class AnalysisError(Exception):
+    pass
+
+
+# Every issue search of the run is made from this pool, so no more requests are in
+# flight than the session keeps keep-alive connections for; failed GETs are retried
+issue_fetch_pool = ThreadPoolExecutor(max_workers=ISSUE_FETCH_WORKERS, thread_name_prefix="issue-fetch")
+sonarqube_session = requests.Session()
+sonarqube_session.auth = (SONARQUBE_TOKEN, '')
+sonarqube_session.mount(SONARQUBE_URL, HTTPAdapter(
+    pool_maxsize=ISSUE_FETCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=["GET"])))
+
+
+def log(message):
+    with print_lock:
+        print(message, flush=True)
+
 # Function to wait for SonarQube server to be ready
 def wait_for_sonarqube(url=SONARQUBE_URL, timeout=120):
     print(f"Waiting for SonarQube server at {url} to be ready...")
@@ -73,22 +117,21 @@ def create_sonarqube_project(project_key, project_name):
     try:
         response = requests.post(api_url, auth=(SONARQUBE_TOKEN, ''), headers=headers, data=payload)
     except Exception as e:
-        print(f"Exception occurred while creating project '{project_name}': {e}", flush=True)
-        sys.exit(1)
+        raise AnalysisError(f"Exception occurred while creating project '{project_name}': {e}")
 
     if response.status_code == 200:
-        print(f"Project '{project_name}' created successfully.")
+        log(f"Project '{project_name}' created successfully.")
     elif response.status_code == 400 and "already exists" in response.text:
-        print(f"Project '{project_name}' already exists.")
+        log(f"Project '{project_name}' already exists.")
     else:
-        print(f"Failed to create project '{project_name}'. Response: {response.text}", flush=True)
-        sys.exit(1)
+        raise AnalysisError(f"Failed to create project '{project_name}'. Response: {response.text}")
 
-# Function to run SonarScanner via Docker
+# Function to run SonarScanner via Docker; returns the compute engine task id
 def run_sonarscanner(project_key, project_name, source_file):
-    print(f"\n--- Running SonarScanner for project: {project_name} ---")
+    log(f"--- Running SonarScanner for project: {project_name} ---")
 
-    # Create a temporary directory for sonar-project.properties
+    # Create a temporary directory for sonar-project.properties and the scanner's
+    # working directory, so concurrent scans of the same source folder don't share one
     with tempfile.TemporaryDirectory() as temp_dir:
         properties_file_path = os.path.join(temp_dir, "sonar-project.properties")
 
@@ -105,6 +148,7 @@ sonar.login={SONARQUBE_TOKEN}
 sonar.scm.enabled=false
 sonar.python.version=3
 sonar.verbose=true
+sonar.working.directory=/opt/scan/scannerwork
 """)
 
         # Define absolute paths
@@ -113,8 +157,7 @@ sonar.verbose=true
 
         # Verify source folder exists
         if not os.path.exists(abs_source_folder):
-            print(f"Error: Source folder '{abs_source_folder}' does not exist.")
-            return
+            raise AnalysisError(f"Source folder '{abs_source_folder}' does not exist.")
 
         # Run SonarScanner Docker container
         scanner_command = [
@@ -122,37 +165,351 @@ sonar.verbose=true
             "-e", f"SONAR_HOST_URL={SONARQUBE_DOCKER_URL}",
             "-v", f"{abs_properties_file}:/opt/sonar-project.properties",
             "-v", f"{abs_source_folder}:/usr/src",
+            "-v", f"{os.path.abspath(temp_dir)}:/opt/scan",
             "sonarsource/sonar-scanner-cli",
             "-X",
             "-Dproject.settings=/opt/sonar-project.properties"
         ]
 
+        # The debug output of concurrent scans would interleave, so each goes to its own log
+        scanner_log = os.path.join(SONARQUBE_REPORTS_FOLDER, f"{project_key}_scanner.log")
+        with scanner_slots, open(scanner_log, 'w') as log_file:
+            result = subprocess.run(scanner_command, stdout=log_file, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            raise AnalysisError(f"Error during SonarScanner analysis for project '{project_name}' "
+                                f"(exit code {result.returncode}), see {scanner_log}")
+        log(f"SonarScanner analysis for project '{project_name}' completed successfully.")
+
+        return read_ce_task_id(os.path.join(temp_dir, "scannerwork", "report-task.txt"))
+
+# Function to read the compute engine task id the scanner reported
+def read_ce_task_id(report_task_file):
+    try:
+        with open(report_task_file) as f:
+            for line in f:
+                if line.startswith("ceTaskId="):
+                    return line.strip().split('=', 1)[1]
+    except OSError:
+        pass
+    return None
+
+# Function to wait until the compute engine has processed an analysis report
+def wait_for_ce_task(task_id, timeout=CE_TASK_TIMEOUT):
+    api_url = f"{SONARQUBE_URL}/api/ce/task"
+    deadline = time.time() + timeout
+    delay = 1
+    while True:
+        response = requests.get(api_url, auth=(SONARQUBE_TOKEN, ''), params={"id": task_id}, timeout=30)
+        if response.status_code != 200:
+            raise AnalysisError(f"Failed to get compute engine task '{task_id}'. Response: {response.text}")
+        task = response.json()["task"]
+        if task["status"] == "SUCCESS":
+            return task
+        if task["status"] in ("FAILED", "CANCELED"):
+            raise AnalysisError(f"Compute engine task '{task_id}' {task['status']}: "
+                                f"{task.get('errorMessage', '')}")
+        if time.time() > deadline:
+            raise AnalysisError(f"Compute engine task '{task_id}' not done after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+
+# Function to compute how long a compute engine task waited before it started
+def ce_queue_seconds(task):
+    try:
+        submitted = datetime.strptime(task["submittedAt"], "%Y-%m-%dT%H:%M:%S%z")
+        started = datetime.strptime(task["startedAt"], "%Y-%m-%dT%H:%M:%S%z")
+    except (KeyError, ValueError):
+        return None
+    return (started - submitted).total_seconds()
+
+# Function to get the number of compute engine workers of the server
+def get_ce_worker_count():
+    try:
+        response = requests.get(f"{SONARQUBE_URL}/api/ce/worker_count", auth=(SONARQUBE_TOKEN, ''), timeout=10)
+        if response.status_code == 200:
+            return int(response.json().get("value", 1))
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return 1
+
+# Function to choose how many scanner containers run at once
+def scanner_pool_size(project_count):
+    if SCANNER_WORKERS > 0:
+        return max(1, min(SCANNER_WORKERS, project_count))
+    # Each scanner is a JVM that keeps about two cores busy; the compute engine then
+    # processes the reports, so more scans than it can absorb only wait in its queue
+    by_cpu = max(1, (os.cpu_count() or 2) // 2)
+    by_ce = get_ce_worker_count() * SCANS_PER_CE_WORKER
+    return max(1, min(by_cpu, by_ce, project_count))
+
+# Function to run one /api/issues/search request in the fetch pool and wait for it
+def search_issues(params):
+    return issue_fetch_pool.submit(request_issues, params).result()
+
+# Function to run one /api/issues/search request over the pooled session
+def request_issues(params):
+    try:
+        response = sonarqube_session.get(f"{SONARQUBE_URL}/api/issues/search", params=params, timeout=60)
+    except requests.exceptions.RequestException as e:
+        raise AnalysisError(f"Exception occurred while searching issues {params}: {e}")
+    if response.status_code != 200:
+        raise AnalysisError(f"Failed to search issues {params}. Response: {response.text}")
+    return response.json()
+
+def issues_total(data):
+    return data.get("paging", {}).get("total", data.get("total", 0))
+
+def parse_sonar_date(value):
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+
+def format_sonar_date(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+# Function to get the creation date range [first, last + 1s) of the issues of a query
+def creation_range(query):
+    if "createdAfter" in query and "createdBefore" in query:
+        return parse_sonar_date(query["createdAfter"]), parse_sonar_date(query["createdBefore"])
+    bounds = []
+    for ascending in ("true", "false"):
+        data = search_issues(dict(query, ps=1, s="CREATION_DATE", asc=ascending))
+        bounds.append(parse_sonar_date(data["issues"][0]["creationDate"]))
+    return bounds[0], bounds[1] + timedelta(seconds=1)
+
+# Function to split an issue query into queries that each stay under the search limit,
+# since /api/issues/search never returns more than ISSUES_SEARCH_LIMIT issues for one
+# query. It is split by severity first and then by halving the creation date range
+# (createdAfter is inclusive, createdBefore exclusive, so the halves do not overlap).
+# Returns (query, total, first page) tuples; the first page of every final query is
+# fetched while planning, so a project below the limit costs no extra request.
+def plan_issue_queries(query):
+    first_page = search_issues(dict(query, ps=ISSUES_PAGE_SIZE, p=1, facets="severities"))
+    total = issues_total(first_page)
+    if total <= ISSUES_SEARCH_LIMIT:
+        return [(query, total, first_page)]
+
+    if "severities" not in query:
+        counts = {value["val"]: value["count"] for facet in first_page.get("facets", [])
+                  if facet.get("property") == "severities" for value in facet.get("values", [])}
+        if sum(counts.values()) == total:
+            return [plan for severity, count in counts.items() if count
+                    for plan in plan_issue_queries(dict(query, severities=severity))]
+
+    after, before = creation_range(query)
+    if before - after <= timedelta(seconds=1):
+        log(f"Warning: {total} issues created at {format_sonar_date(after)} match {query}, "
+            f"only the first {ISSUES_SEARCH_LIMIT} are exported.")
+        return [(query, ISSUES_SEARCH_LIMIT, first_page)]
+    middle = after + timedelta(seconds=int((before - after).total_seconds()) // 2)
+    return (plan_issue_queries(dict(query, createdAfter=format_sonar_date(after), createdBefore=format_sonar_date(middle))) +
+            plan_issue_queries(dict(query, createdAfter=format_sonar_date(middle), createdBefore=format_sonar_date(before))))
+
+# Function to export every issue of a project to a JSON Lines file, one issue per line.
+# The remaining pages of all queries are fetched concurrently in the shared fetch pool
+# and each page is written out as soon as it arrives, so the issues are never all held
+# in memory (and their order is the order the pages came in). Returns (issue count,
+# components).
+def export_issues(project_key, jsonl_file):
+    plans = plan_issue_queries({"componentKeys": project_key})
+    components = {}
+    seen = set()  # issue keys, against an issue moving between queries mid-export
+
+    def write_page(out, data):
+        written = 0
+        for issue in data.get("issues", []):
+            if issue["key"] not in seen:
+                seen.add(issue["key"])
+                out.write(json.dumps(issue) + "\n")
+                written += 1
+        for component in data.get("components", []):
+            components[component["key"]] = component
+        return written
+
+    count = 0
+    with open(jsonl_file, 'w') as out:
+        futures = []
+        for query, total, first_page in plans:
+            count += write_page(out, first_page)
+            pages = -(-min(total, ISSUES_SEARCH_LIMIT) // ISSUES_PAGE_SIZE)
+            futures.extend(issue_fetch_pool.submit(request_issues, dict(query, ps=ISSUES_PAGE_SIZE, p=page))
+                           for page in range(2, pages + 1))
         try:
-            subprocess.run(scanner_command, check=True)
-            print(f"SonarScanner analysis for project '{project_name}' completed successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error during SonarScanner analysis for project '{project_name}': {e}", flush=True)
-            sys.exit(1)
+            for future in as_completed(futures):
+                count += write_page(out, future.result())
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    return count, list(components.values())
+
+# Function to convert an issue effort such as "1d2h30min" to minutes (SonarQube days are 8h)
+def effort_minutes(effort):
+    minutes = 0
+    for amount, unit in re.findall(r'(\d+)(d|h|min)', effort or ""):
+        minutes += int(amount) * {"d": 480, "h": 60, "min": 1}[unit]
+    return minutes
 
-# Function to fetch SonarQube issues via API
+# Function to write the <key>_issues.json report, shaped like an /api/issues/search
+# response holding all issues, from an exported JSON Lines file. The issues are copied
+# line by line rather than loaded. Returns the number of issues.
+def write_issues_report(jsonl_file, components, output_file):
+    total = 0
+    effort = 0
+    with open(jsonl_file) as issues, open(output_file, 'w') as out:
+        out.write('{\n    "issues": [')
+        for line in issues:
+            issue = json.loads(line)
+            effort += effort_minutes(issue.get("effort"))
+            out.write((",\n        " if total else "\n        ") + line.rstrip("\n"))
+            total += 1
+        out.write("\n    ],\n")
+        trailer = {
+            "total": total,
+            "p": 1,
+            "ps": total,
+            "paging": {"pageIndex": 1, "pageSize": total, "total": total},
+            "effortTotal": effort,
+            "components": components,
+            "facets": [],
+        }
+        out.write(json.dumps(trailer, indent=4)[2:])
+    return total
+
+# Function to fetch SonarQube issues via API: exported to <key>_issues.jsonl, then
+# written out as the <key>_issues.json report. Returns the number of issues.
 def fetch_sonarqube_issues(project_key, output_file):
-    api_url = f"{SONARQUBE_URL}/api/issues/search"
-    params = {
-        "projectKeys": project_key,
-        "ps": 500  # Page size: adjust as needed
-    }
+    jsonl_file = os.path.splitext(output_file)[0] + ".jsonl"
+    _, components = export_issues(project_key, jsonl_file)
+    total = write_issues_report(jsonl_file, components, output_file)
+    log(f"{total} issues for project '{project_key}' saved to '{output_file}'.")
+    return total
+
+# Function to get the per-file report key of a component: the first path element
+# without its .py suffix, so "pyexample_ver1.py" -> "pyexample_ver1" (the project key
+# per-file mode uses) and a version directory "ver2/a/b.py" -> "ver2"
+def report_key_for(component_key, project_key):
+    path = component_key[len(project_key) + 1:] if component_key.startswith(f"{project_key}:") else component_key
+    first = path.split('/', 1)[0]
+    return first[:-len('.py')] if first.endswith('.py') else first
+
+# Function to split a single-pass project's exported issues into the <key>_issues.jsonl
+# and <key>_issues.json reports per-file mode writes. Component and project keys are
+# rewritten to the per-file project key, so the reports read the same as if each file
+# had been its own project. Returns the number of issues.
+def partition_issues(project_key, jsonl_file, components, report_keys):
+    report_file = lambda key, ext: os.path.join(SONARQUBE_REPORTS_FOLDER, f"{key}_issues{ext}")
+    outputs = {key: open(report_file(key, ".jsonl"), 'w') for key in report_keys}
+    project_level = 0
     try:
-        response = requests.get(api_url, auth=(SONARQUBE_TOKEN, ''), params=params)
-    except Exception as e:
-        print(f"Exception occurred while fetching issues for project '{project_key}': {e}", flush=True)
-        sys.exit(1)
+        with open(jsonl_file) as issues:
+            for line in issues:
+                issue = json.loads(line)
+                if not issue.get("component", "").startswith(f"{project_key}:"):
+                    # Raised on the project itself, not on any one file
+                    project_level += 1
+                    continue
+                key = report_key_for(issue["component"], project_key)
+                issue = dict(issue, project=key, component=issue.get("component", "").replace(project_key, key, 1))
+                if key not in outputs:
+                    outputs[key] = open(report_file(key, ".jsonl"), 'w')
+                outputs[key].write(json.dumps(issue) + "\n")
+    finally:
+        for out in outputs.values():
+            out.close()
+    if project_level:
+        log(f"Warning: skipped {project_level} project-level issues of '{project_key}'; they belong to no file report.")
 
-    if response.status_code == 200:
-        with open(output_file, 'w') as f:
-            json.dump(response.json(), f, indent=4)
-        print(f"Issues for project '{project_key}' saved to '{output_file}'.")
+    partitions = {key: [] for key in outputs}
+    for component in components:
+        if component.get("qualifier") == "TRK":
+            continue
+        key = report_key_for(component["key"], project_key)
+        if key in partitions:
+            partitions[key].append(dict(component, key=component["key"].replace(project_key, key, 1)))
+
+    count = 0
+    for key, key_components in partitions.items():
+        output_file = report_file(key, ".json")
+        total = write_issues_report(report_file(key, ".jsonl"), key_components, output_file)
+        log(f"{total} issues for '{key}' saved to '{output_file}'.")
+        count += total
+    return count
+# Function for single-pass SonarQube analysis: the source tree is scanned once as one
+# project and its issues are partitioned per file, instead of one full scan per file
+def run_single_pass_analysis():
+    print("\n=== Running SonarQube Analysis (single pass) ===")
+
+    python_files = [f for f in os.listdir(SOURCE_CODE_FOLDER) if f.endswith('.py') and os.path.isfile(os.path.join(SOURCE_CODE_FOLDER, f))]
+    project_key = SINGLE_PASS_PROJECT_KEY
+    project_name = "PyExample Source"
+    timings = {"project": project_key}
+    start = time.time()
+    try:
+        create_sonarqube_project(project_key, project_name)
+        timings["create"] = time.time() - start
+
+        step = time.time()
+        task_id = run_sonarscanner(project_key, project_name, None)
+        timings["scan"] = time.time() - step
+
+        step = time.time()
+        if task_id:
+            task = wait_for_ce_task(task_id)
+            timings["ce_queue"] = ce_queue_seconds(task)
+            timings["ce_execution"] = task.get("executionTimeMs", 0) / 1000
+        timings["ce_wait"] = time.time() - step
+
+        step = time.time()
+        # Not named *_issues.jsonl, so no per-file report can overwrite it while it is read
+        export_file = os.path.join(SONARQUBE_REPORTS_FOLDER, f"{project_key}_export.jsonl")
+        _, components = export_issues(project_key, export_file)
+        # Every .py file gets a report, also the ones without issues
+        timings["issues"] = partition_issues(project_key, export_file, components,
+                                             [os.path.splitext(f)[0] for f in python_files])
+        timings["fetch"] = time.time() - step
+    except (AnalysisError, requests.exceptions.RequestException, OSError, ValueError) as e:
+        log(f"Analysis of '{project_key}' failed: {e}")
+        write_analysis_summary([], [{"project": project_key, "error": str(e)}], 1, time.time() - start)
+        return False
+    timings["total"] = time.time() - start
+
+    write_analysis_summary([timings], [], 1, timings["total"])
+    print(f"\nAccess the SonarQube web interface at {SONARQUBE_URL} to view the results.")
+    return True
+
+# Function to analyse one project: create, scan, wait for the compute engine, fetch issues.
+# Returns the timings of each step in seconds.
+def analyze_project(project_key, project_name, py_file):
+    timings = {"project": project_key}
+    start = time.time()
+
+    # Create SonarQube project
+    create_sonarqube_project(project_key, project_name)
+    timings["create"] = time.time() - start
+
+    # Run SonarScanner for the project
+    step = time.time()
+    task_id = run_sonarscanner(project_key, project_name, py_file)
+    timings["scan"] = time.time() - step
+
+    # Issues are only searchable once the compute engine has processed the report
+    step = time.time()
+    if task_id:
+        task = wait_for_ce_task(task_id)
+        # Time the report waited for a free compute engine worker, then its processing time
+        timings["ce_queue"] = ce_queue_seconds(task)
+        timings["ce_execution"] = task.get("executionTimeMs", 0) / 1000
     else:
-        print(f"Failed to fetch issues for project '{project_key}'. Response: {response.text}", flush=True)
+        log(f"No compute engine task reported for '{project_key}', fetching issues right away.")
+    timings["ce_wait"] = time.time() - step
+
+    # Fetch and save issues to reports folder
+    step = time.time()
+    issues_output = os.path.join(SONARQUBE_REPORTS_FOLDER, f"{project_key}_issues.json")
+    timings["issues"] = fetch_sonarqube_issues(project_key, issues_output)
+    timings["fetch"] = time.time() - step
+
+    timings["total"] = time.time() - start
+    return timings
 
 # Function for SonarQube analysis
 def run_sonarqube_analysis():
@@ -163,32 +520,82 @@ def run_sonarqube_analysis():
 
     if not python_files:
         print("No Python files found in the source_code directory.")
-        return
+        return True
 
+    projects = []
     for py_file in python_files:
         project_key = os.path.splitext(py_file)[0]  # e.g., pyexample_ver1
         # Format project name, e.g., PyExample Ver1
         version_part = project_key.split('_')[-1].capitalize() if '_' in project_key else 'V1'
         project_name = f"PyExample {version_part}"
+        projects.append((project_key, project_name, py_file))
 
-        # Create SonarQube project
-        create_sonarqube_project(project_key, project_name)
-
-        # Run SonarScanner for the project
-        run_sonarscanner(project_key, project_name, py_file)
+    # Scans run in a bounded pool of scanner containers, so the wall time is close to
+    # the slowest project rather than the sum of all of them. A scanner slot is only held
+    # while the container runs; waiting for the compute engine and fetching issues
+    # overlap with the next scans.
+    global scanner_slots
+    workers = scanner_pool_size(len(projects))
+    scanner_slots = threading.Semaphore(workers)
+    print(f"Analysing {len(projects)} projects with {workers} concurrent scanners.", flush=True)
+    start = time.time()
+    results = []
+    failures = []
+    with ThreadPoolExecutor(max_workers=min(len(projects), workers * 2)) as pool:
+        futures = {pool.submit(analyze_project, *project): project[0] for project in projects}
+        for future in as_completed(futures):
+            project_key = futures[future]
+            try:
+                results.append(future.result())
+            except (AnalysisError, requests.exceptions.RequestException, OSError, ValueError) as e:
+                log(f"Analysis of '{project_key}' failed: {e}")
+                failures.append({"project": project_key, "error": str(e)})
+    wall_time = time.time() - start
 
-        # Fetch and save issues to reports folder
-        issues_output = os.path.join(SONARQUBE_REPORTS_FOLDER, f"{project_key}_issues.json")
-        fetch_sonarqube_issues(project_key, issues_output)
+    write_analysis_summary(results, failures, workers, wall_time)
 
     print("\nSonarQube analysis completed for all projects.")
     print(f"Access the SonarQube web interface at {SONARQUBE_URL} to view the results.")
+    return not failures
+
+# Function to print per-project timings and save them with the aggregate
+def write_analysis_summary(results, failures, workers, wall_time):
+    results.sort(key=lambda r: r["project"])
+    print(f"\n{'project':<30} {'create':>8} {'scan':>8} {'ce wait':>8} {'fetch':>8} {'total':>8}")
+    for r in results:
+        print(f"{r['project']:<30} {r['create']:>8.1f} {r['scan']:>8.1f} {r['ce_wait']:>8.1f} "
+              f"{r['fetch']:>8.1f} {r['total']:>8.1f}")
+    serial_time = sum(r["total"] for r in results)
+    summary = {
+        "projects": len(results) + len(failures),
+        "succeeded": len(results),
+        "failed": len(failures),
+        "scanner_workers": workers,
+        "wall_time": wall_time,
+        # What the same projects took added up, i.e. roughly a one-at-a-time run
+        "sum_of_project_times": serial_time,
+        "slowest_project": max((r["total"] for r in results), default=0.0),
+        "speedup": serial_time / wall_time if wall_time else None,
+        "results": results,
+        "failures": failures,
+    }
+    print(f"\nWall time {wall_time:.1f}s for {summary['projects']} projects "
+          f"(sum of project times {serial_time:.1f}s, slowest {summary['slowest_project']:.1f}s, "
+          f"{len(failures)} failed)")
+    summary_file = os.path.join(SONARQUBE_REPORTS_FOLDER, "analysis_summary.json")
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=4)
+    print(f"Timings saved to '{summary_file}'.")
 
 # Main function to parse arguments and run analysis
 def main():
     parser = argparse.ArgumentParser(description="Run static analysis on source code")
     parser.add_argument("--tool", choices=["sonarqube", "all"], default="all",
                         help="Select which tool to run (default: all)")
+    parser.add_argument("--scan-mode", choices=["per-file", "single-pass"], default="per-file",
+                        help="per-file: one project and scan per source file; single-pass: scan the "
+                             "tree once and split the issues into the same per-file reports "
+                             "(default: per-file)")
     args = parser.parse_args()
 
     # Ensure the SonarQube reports folder exists
@@ -196,7 +603,9 @@ def main():
 
     if args.tool in ["sonarqube", "all"]:
         wait_for_sonarqube()
-        run_sonarqube_analysis()
+        analysis = run_single_pass_analysis if args.scan_mode == "single-pass" else run_sonarqube_analysis
+        if not analysis():
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()